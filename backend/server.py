@@ -1,24 +1,59 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict, Any
+import re
 import uuid
-from datetime import datetime, timezone
+import json
+import base64
+import codecs
+import functools
+import math
+import time
+import hashlib
+import hmac
+import ipaddress
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
 import requests
+from requests.adapters import HTTPAdapter
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
 
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # optional: fall back to gzip only
+    BrotliMiddleware = None
+
+
+PROCESS_START = time.monotonic()
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection (the client is opened in the lifespan handler)
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+# Shared HTTP connection pool for upstream and n8n calls
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+http_session = requests.Session()
+http_session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE))
+http_session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE))
 
 # External endpoints (not internal service URLs)
 BLAXING_API_BASE = os.environ.get("BLAXING_API_BASE", "https://blaxing.fr/api")
@@ -27,8 +62,87 @@ N8N_WEBHOOK_BASE = os.environ.get("N8N_WEBHOOK_BASE", "https://n8n.blaxing.fr/we
 REQ_TIMEOUT = 10
 EMERGENT_DRY_RUN = os.environ.get("EMERGENT_DRY_RUN", "true").lower() == "true"
 
+# Write-behind buffer for status checks
+STATUS_BATCH_SIZE = int(os.environ.get("STATUS_BATCH_SIZE", "500"))
+STATUS_FLUSH_INTERVAL = float(os.environ.get("STATUS_FLUSH_INTERVAL", "0.5"))
+STATUS_BUFFER_MAX = int(os.environ.get("STATUS_BUFFER_MAX", "10000"))
+STATUS_BATCH_MAX_ITEMS = int(os.environ.get("STATUS_BATCH_MAX_ITEMS", "1000"))
+
+# Status check retention (seconds) for raw documents and rollups
+STATUS_RETENTION_SECONDS = int(os.environ.get("STATUS_RETENTION_SECONDS", str(7 * 24 * 3600)))
+STATUS_ROLLUP_RETENTION_SECONDS = int(os.environ.get("STATUS_ROLLUP_RETENTION_SECONDS", str(90 * 24 * 3600)))
+STATUS_ROLLUP_BUCKETS = {"1m": "minute", "1h": "hour"}
+
+# Background mirror of upstream agents (comma separated sources, e.g. "prod,staging")
+BLAXING_MIRROR_SOURCES = [s.strip().lower() for s in os.environ.get("BLAXING_MIRROR_SOURCES", "").split(",") if s.strip()]
+BLAXING_MIRROR_INTERVAL = float(os.environ.get("BLAXING_MIRROR_INTERVAL", "30"))
+
+# Agent listing: page size and proxy-mode cache of the upstream list
+AGENTS_PAGE_DEFAULT = int(os.environ.get("AGENTS_PAGE_DEFAULT", "500"))
+AGENTS_PAGE_MAX = int(os.environ.get("AGENTS_PAGE_MAX", "1000"))
+AGENTS_PROXY_CACHE_TTL = float(os.environ.get("AGENTS_PROXY_CACHE_TTL", "5"))
+AGENTS_PROXY_CACHE_SIZE = int(os.environ.get("AGENTS_PROXY_CACHE_SIZE", "4"))
+AGENT_SORT_FIELDS = ("agent_id", "name", "created_at", "updated_at")
+UPSTREAM_STREAM_CHUNK = int(os.environ.get("UPSTREAM_STREAM_CHUNK", str(64 * 1024)))
+
+# Multi-source overview
+OVERVIEW_SOURCES = ("mock", "staging", "prod")
+OVERVIEW_SOURCE_TIMEOUT = float(os.environ.get("OVERVIEW_SOURCE_TIMEOUT", "3"))
+
+# Conditional GET / compression
+ETAG_VERSION_TTL = float(os.environ.get("ETAG_VERSION_TTL", "1"))
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+
+# Admission control: per-client token bucket (0 disables) and per-pool concurrency
+RATE_LIMIT_RPS = float(os.environ.get("RATE_LIMIT_RPS", "20"))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", "40"))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "10000"))
+# X-Forwarded-For is only honoured when the peer is one of these proxies (IPs or CIDRs)
+TRUSTED_PROXIES = [ipaddress.ip_network(p.strip(), strict=False) for p in os.environ.get("TRUSTED_PROXIES", "").split(",") if p.strip()]
+ADMISSION_UPSTREAM_CONCURRENCY = int(os.environ.get("ADMISSION_UPSTREAM_CONCURRENCY", "16"))
+ADMISSION_LOCAL_CONCURRENCY = int(os.environ.get("ADMISSION_LOCAL_CONCURRENCY", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "0.5"))
+
+# Idempotency-Key support for mutating endpoints
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "2048"))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get("IDEMPOTENCY_WAIT_TIMEOUT", "20"))
+IDEMPOTENCY_LEASE_SECONDS = float(os.environ.get("IDEMPOTENCY_LEASE_SECONDS", str(REQ_TIMEOUT + 5)))
+
+# Webhook fan-out
+WEBHOOK_TIMEOUT = float(os.environ.get("WEBHOOK_TIMEOUT", "5"))
+WEBHOOK_DEST_CONCURRENCY = int(os.environ.get("WEBHOOK_DEST_CONCURRENCY", "4"))
+WEBHOOK_DEST_QUEUE = int(os.environ.get("WEBHOOK_DEST_QUEUE", "100"))
+WEBHOOK_EVENTS = {"agent_activation", "agent_deactivation", "status_change"}
+
+# Warm-up state reported by /api/ready
+warmup: Dict[str, Any] = {"ready": False, "cold_start_seconds": None, "steps": {}}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db
+    # tz_aware: BSON dates (status timestamps, rollups, history) come back as UTC-aware datetimes.
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True, minPoolSize=MONGO_MIN_POOL_SIZE, maxPoolSize=MONGO_MAX_POOL_SIZE)
+    db = client[os.environ['DB_NAME']]
+    task = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await stop_mirrors()
+        await webhook_dispatcher.drain(timeout=WEBHOOK_TIMEOUT)
+        await status_buffer.stop()
+        client.close()
+        http_session.close()
+
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -49,6 +163,11 @@ def parse_iso(dt_str: Optional[str]) -> Optional[datetime]:
         return None
 
 
+def as_utc(dt: datetime) -> datetime:
+    # Motor returns naive datetimes (UTC) unless the client is tz_aware.
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
 # ---------- Models ----------
 
 class StatusCheck(BaseModel):
@@ -62,6 +181,15 @@ class StatusCheckCreate(BaseModel):
     client_name: str
 
 
+class StatusStatsBucket(BaseModel):
+    client_name: str
+    bucket: str
+    start: datetime
+    count: int
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
+
+
 class AgentCreate(BaseModel):
     agent_id: str
     image: Optional[str] = None
@@ -83,12 +211,76 @@ class Agent(BaseModel):
     last_heartbeat: Optional[datetime] = None
 
 
+class SourceResult(BaseModel):
+    ok: bool
+    count: int = 0
+    elapsed_ms: int
+    data_age: Optional[int] = None
+    error: Optional[str] = None
+
+
+class AgentSourceState(BaseModel):
+    state: str
+    name: str
+    image: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+
+class AgentOverviewEntry(BaseModel):
+    agent_id: str
+    sources: Dict[str, AgentSourceState]
+    missing_in: List[str] = Field(default_factory=list)
+    drift: bool = False
+
+
+class AgentsOverview(BaseModel):
+    sources: Dict[str, SourceResult]
+    agents: List[AgentOverviewEntry]
+
+
+class AgentEvent(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    agent_id: str
+    source: str
+    from_state: Optional[str] = None
+    to_state: str
+    trigger: str
+    at: datetime
+
+
+class AgentUptime(BaseModel):
+    agent_id: str
+    source: str
+    state: Optional[str] = None
+    window_start: datetime
+    window_end: datetime
+    window_seconds: int
+    active_seconds: int
+    availability: float
+    transitions: int
+
+
 class HooksConfig(BaseModel):
     activation_flow: Optional[str] = None
     deactivation_flow: Optional[str] = None
     status_change_flow: Optional[str] = None
 
 
+class WebhookSubscriptionCreate(BaseModel):
+    event: str
+    flow: Optional[str] = None
+    url: Optional[str] = None
+    agent_ids: Optional[List[str]] = None
+    sources: Optional[List[str]] = None
+    enabled: bool = True
+
+
+class WebhookSubscription(WebhookSubscriptionCreate):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
 class HookNotifyRequest(BaseModel):
     flow: str
     event: str
@@ -100,6 +292,543 @@ class TriggerUrlRequest(BaseModel):
     payload: Optional[Dict[str, Any]] = None
 
 
+# ---------- Collection versions (ETags) ----------
+
+class CollectionVersions:
+    """Per-collection version counters shared through Mongo.
+
+    Writers call `bump`; readers use `get`, which serves from an in-process
+    cache for up to `ttl` seconds so conditional GETs skip the database.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._cache: Dict[str, tuple] = {}
+
+    async def get(self, name: str) -> int:
+        cached = self._cache.get(name)
+        if cached and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+        doc = await db.collection_versions.find_one({"_id": name})
+        version = doc.get("v", 0) if doc else 0
+        self._cache[name] = (version, time.monotonic())
+        return version
+
+    async def bump(self, name: str) -> int:
+        try:
+            doc = await db.collection_versions.find_one_and_update(
+                {"_id": name}, {"$inc": {"v": 1}}, upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            # Without a bump readers could get a stale 304; drop the cache so they refetch.
+            logger.warning(f"version bump failed for {name}: {e}")
+            self._cache.pop(name, None)
+            return 0
+        self._cache[name] = (doc["v"], time.monotonic())
+        return doc["v"]
+
+
+collection_versions = CollectionVersions(ETAG_VERSION_TTL)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: compression may change the bytes but not the representation.
+    opaque = etag.removeprefix("W/")
+    return opaque in {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+
+
+async def not_modified(request: Request, response: Response, name: str, variant: str = "") -> Optional[Response]:
+    """Return a 304 if the client's ETag matches `name`'s version, else tag `response`.
+
+    `variant` distinguishes representations of the same collection (e.g. query parameters).
+    """
+    tag = f"{name}-{await collection_versions.get(name)}"
+    if variant:
+        tag += "-" + hashlib.sha1(variant.encode()).hexdigest()[:12]
+    etag = f'W/"{tag}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
+
+
+# ---------- Admission control ----------
+
+class TokenBucketLimiter:
+    """In-process token buckets keyed by client address.
+
+    At most `max_keys` buckets are kept; the least recently used one is
+    evicted first, so clients being throttled right now keep their state.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max(1, max_keys)
+        self._buckets: OrderedDict = OrderedDict()
+
+    def acquire(self, key: str) -> float:
+        """Take one token; return 0 on success or the seconds until one is available."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            while len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            self._buckets.move_to_end(key)
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+
+class AdmissionPool:
+    """Concurrency limit with a bounded queue wait; callers past the deadline are shed."""
+
+    def __init__(self, name: str, limit: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._sem = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.shed = 0
+
+    async def acquire(self) -> bool:
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._sem.release()
+
+
+rate_limiter = TokenBucketLimiter(RATE_LIMIT_RPS, RATE_LIMIT_BURST, RATE_LIMIT_MAX_KEYS) if RATE_LIMIT_RPS > 0 else None
+admission_pools = {
+    "upstream": AdmissionPool("upstream", ADMISSION_UPSTREAM_CONCURRENCY, ADMISSION_QUEUE_TIMEOUT),
+    "local": AdmissionPool("local", ADMISSION_LOCAL_CONCURRENCY, ADMISSION_QUEUE_TIMEOUT),
+}
+UPSTREAM_PATHS = {"/api/hooks/notify", "/api/n8n/trigger-url", "/api/agents/overview"}
+
+
+# Ingest routes have their own backpressure (the write-behind buffer) and are sent at high rates.
+RATE_LIMIT_EXEMPT = {("POST", "/api/status"), ("POST", "/api/status/batch")}
+
+
+def is_trusted_proxy(addr: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in net for net in TRUSTED_PROXIES)
+
+
+def client_address(request: Request) -> str:
+    peer = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(peer):
+        return peer
+    # Walk the chain from the right: the first hop not added by a trusted proxy is the client.
+    hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+
+def rate_limit_key(request: Request) -> str:
+    # Not X-API-KEY: mock and local routes never validate it, so a fresh key per request would get a fresh bucket.
+    return "ip:" + client_address(request)
+
+
+def admission_pool_for(request: Request) -> AdmissionPool:
+    path = request.url.path
+    if path in UPSTREAM_PATHS:
+        return admission_pools["upstream"]
+    src = (request.headers.get("x-blaxing-source") or "mock").lower()
+    if src not in ("prod", "staging"):
+        return admission_pools["local"]
+    mirror = mirrors.get(src)
+    if path == "/api/agents/list" and mirror is not None and mirror.serves(request.headers.get("x-api-key"), request.headers.get("x-blaxing-base")):
+        return admission_pools["local"]
+    return admission_pools["upstream"]
+
+
+async def admission_control(request: Request, call_next):
+    if request.method == "OPTIONS" or not request.url.path.startswith("/api") or request.url.path == "/api/ready":
+        return await call_next(request)
+    if rate_limiter is not None and (request.method, request.url.path) not in RATE_LIMIT_EXEMPT:
+        wait = rate_limiter.acquire(rate_limit_key(request))
+        if wait:
+            return JSONResponse({"detail": "Rate limit exceeded"}, status_code=429, headers={"Retry-After": str(math.ceil(wait))})
+    pool = admission_pool_for(request)
+    if not await pool.acquire():
+        logger.warning(f"admission shed pool={pool.name} path={request.url.path}")
+        return JSONResponse({"detail": f"Server busy ({pool.name})"}, status_code=503, headers={"Retry-After": "1"})
+    try:
+        response = await call_next(request)
+    except BaseException:
+        pool.release()
+        raise
+    # call_next returns before the body is sent; streamed bodies (/agents/stream)
+    # keep talking to upstream, so hold the slot until the body is done.
+    response.body_iterator = release_after_body(response.body_iterator, pool)
+    return response
+
+
+async def release_after_body(body, pool: AdmissionPool):
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        pool.release()
+
+
+# ---------- Idempotency ----------
+
+class IdempotencyStore:
+    """Stores the first response for each Idempotency-Key and replays it on retries.
+
+    Completed responses live in db.idempotency_keys (TTL-indexed) behind an
+    in-memory LRU. Duplicates arriving while the first call still runs wait for
+    it: in-process through a shared future, across workers by polling the
+    pending document. A pending claim is a lease: once `pending_until` has
+    passed (owner died or never released it) a waiter takes it over.
+    """
+
+    def __init__(self, ttl: int, cache_size: int, wait_timeout: float, lease: float):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.wait_timeout = wait_timeout
+        self.lease = lease
+        self._lru: OrderedDict = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def ensure_indexes(self):
+        try:
+            await db.idempotency_keys.create_index("created_at", expireAfterSeconds=self.ttl)
+        except Exception as e:
+            logger.exception(f"idempotency index setup failed: {e}")
+
+    def _cache_get(self, scope: str) -> Optional[Dict[str, Any]]:
+        entry = self._lru.get(scope)
+        if entry is None:
+            return None
+        if entry["expires"] < time.monotonic():
+            del self._lru[scope]
+            return None
+        self._lru.move_to_end(scope)
+        return entry
+
+    def _cache_put(self, scope: str, fingerprint: str, body: Any):
+        self._lru[scope] = {"fingerprint": fingerprint, "body": body, "expires": time.monotonic() + self.ttl}
+        self._lru.move_to_end(scope)
+        while len(self._lru) > self.cache_size:
+            self._lru.popitem(last=False)
+
+    @staticmethod
+    def _replay(entry: Dict[str, Any], fingerprint: str) -> JSONResponse:
+        if entry["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        return JSONResponse(content=entry["body"], headers={"Idempotent-Replayed": "true"})
+
+    async def run(self, scope: str, fingerprint: str, fn):
+        while True:
+            entry = self._cache_get(scope)
+            if entry is not None:
+                return self._replay(entry, fingerprint)
+            pending = self._inflight.get(scope)
+            if pending is None:
+                break
+            # A None result means the first call failed; loop and try ourselves.
+            await asyncio.shield(pending)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[scope] = fut
+        try:
+            return await self._claim_and_execute(scope, fingerprint, fn)
+        finally:
+            del self._inflight[scope]
+            fut.set_result(None)
+
+    async def _claim(self, scope: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Try to own `scope`; return None when claimed, else the current document ({} if it vanished)."""
+        now = datetime.now(timezone.utc)
+        lease_until = now + timedelta(seconds=self.lease)
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": scope, "fingerprint": fingerprint, "state": "pending", "created_at": now, "pending_until": lease_until,
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+        taken = await db.idempotency_keys.find_one_and_update(
+            {"_id": scope, "state": "pending", "fingerprint": fingerprint, "pending_until": {"$lt": now}},
+            {"$set": {"pending_until": lease_until}},
+        )
+        if taken is not None:
+            logger.warning("idempotency: took over an expired pending claim")
+            return None
+        return await db.idempotency_keys.find_one({"_id": scope}) or {}
+
+    async def _claim_and_execute(self, scope: str, fingerprint: str, fn):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            doc = await self._claim(scope, fingerprint)
+            if doc is None:
+                break
+            if doc.get("fingerprint") not in (None, fingerprint):
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            if doc.get("state") == "done":
+                self._cache_put(scope, doc["fingerprint"], doc["response"])
+                return self._replay(self._lru[scope], fingerprint)
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(0.1)
+        try:
+            result = await fn()
+        except BaseException:
+            await db.idempotency_keys.delete_one({"_id": scope})
+            raise
+        body = jsonable_encoder(result)
+        await db.idempotency_keys.update_one({"_id": scope}, {"$set": {"state": "done", "response": body}})
+        self._cache_put(scope, fingerprint, body)
+        return result
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_WAIT_TIMEOUT, IDEMPOTENCY_LEASE_SECONDS)
+
+
+def idempotent(endpoint):
+    """Replay the stored response when the endpoint is retried with the same Idempotency-Key."""
+
+    @functools.wraps(endpoint)
+    async def wrapper(**kwargs):
+        key = kwargs.get("idempotency_key")
+        if not key:
+            return await endpoint(**kwargs)
+        args = {k: v for k, v in kwargs.items() if k not in ("idempotency_key", "x_api_key")}
+        api_key = kwargs.get("x_api_key") or ""
+        scope = hashlib.sha256(f"{endpoint.__name__}|{api_key}|{key}".encode()).hexdigest()
+        fingerprint = hashlib.sha256(json.dumps(jsonable_encoder(args), sort_keys=True).encode()).hexdigest()
+        return await idempotency_store.run(scope, fingerprint, lambda: endpoint(**kwargs))
+
+    return wrapper
+
+
+# ---------- Write-behind buffer ----------
+
+class WriteBehindBuffer:
+    """Collects documents in memory and flushes them with insert_many.
+
+    A flush happens when `batch_size` documents are pending or every
+    `flush_interval` seconds, whichever comes first. `offer` refuses new
+    documents once `max_pending` is reached so callers can shed load.
+    """
+
+    def __init__(self, collection_name: str, batch_size: int, flush_interval: float, max_pending: int, on_flush=None):
+        self.collection_name = collection_name
+        self.on_flush = on_flush
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.batch_size, max_pending)
+        self._pending: List[Dict[str, Any]] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def offer(self, docs: List[Dict[str, Any]]) -> bool:
+        if len(self._pending) + len(docs) > self.max_pending:
+            return False
+        self._pending.extend(docs)
+        if self._wake is not None and len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            # Never started (storage not set up yet): writing now could create the wrong layout.
+            if self._pending:
+                logger.warning(f"write-behind stopped before start, dropped {len(self._pending)} docs")
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception(f"write-behind flush failed: {e}")
+
+    async def flush(self) -> int:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        written = 0
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                try:
+                    res = await db[self.collection_name].insert_many(batch, ordered=False)
+                    written += len(res.inserted_ids)
+                    inserted = batch
+                except BulkWriteError as e:
+                    # Duplicate ids from a retried batch are expected; everything else is dropped.
+                    failed = {err.get("index") for err in e.details.get("writeErrors", [])}
+                    inserted = [d for i, d in enumerate(batch) if i not in failed]
+                    written += e.details.get("nInserted", 0)
+                    logger.warning(f"write-behind batch partially failed: {len(failed)} errors")
+                except Exception as e:
+                    if len(self._pending) + len(batch) <= self.max_pending:
+                        self._pending[:0] = batch
+                        logger.warning(f"write-behind flush failed, requeued {len(batch)} docs: {e}")
+                    else:
+                        logger.error(f"write-behind flush failed, dropped {len(batch)} docs: {e}")
+                    break
+                if self.on_flush is not None and inserted:
+                    try:
+                        await self.on_flush(inserted)
+                    except Exception as e:
+                        logger.exception(f"write-behind on_flush failed: {e}")
+        return written
+
+
+# ---------- Status check storage & rollups ----------
+
+def bucket_start(ts: datetime, bucket: str) -> datetime:
+    if bucket == "1h":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(second=0, microsecond=0)
+
+
+async def ensure_status_storage():
+    """Create status_checks as a time-series collection, or a TTL-indexed plain one.
+
+    Time-series only applies to databases without a status_checks collection;
+    an existing plain collection is kept and its legacy ISO-string timestamps
+    are converted to dates so the TTL index and the rollups cover them.
+    """
+    try:
+        await db.create_collection(
+            "status_checks",
+            timeseries={"timeField": "timestamp", "metaField": "client_name", "granularity": "seconds"},
+            expireAfterSeconds=STATUS_RETENTION_SECONDS,
+        )
+        logger.info("status_checks created as time-series collection")
+    except CollectionInvalid:
+        # Already there: either ours from a previous start, or a pre-time-series deployment.
+        pass
+    except OperationFailure as e:
+        # Servers older than 5.0 have no time-series support.
+        logger.warning(f"time-series unavailable, using indexed collection: {e}")
+    except Exception as e:
+        logger.exception(f"status storage setup failed: {e}")
+        return
+    try:
+        opts = await db.status_checks.options()
+        if "timeseries" not in opts:
+            logger.warning(
+                "status_checks is a plain collection; time-series storage only applies to new databases "
+                "(on MongoDB 5.0+ rename it, e.g. to status_checks_legacy, to adopt time-series)"
+            )
+            await db.status_checks.create_index([("client_name", 1), ("timestamp", 1)])
+            await db.status_checks.create_index("timestamp", expireAfterSeconds=STATUS_RETENTION_SECONDS)
+            await migrate_legacy_status_timestamps()
+        await db.status_rollups.create_index([("bucket", 1), ("client_name", 1), ("start", 1)])
+        await db.status_rollups.create_index([("bucket", 1), ("start", 1)])
+        await db.status_rollups.create_index("start", expireAfterSeconds=STATUS_ROLLUP_RETENTION_SECONDS)
+    except Exception as e:
+        logger.exception(f"status storage setup failed: {e}")
+
+
+async def migrate_legacy_status_timestamps() -> int:
+    """Convert ISO-string timestamps written before status checks were stored as BSON dates."""
+    migrated = 0
+    while True:
+        docs = await db.status_checks.find({"timestamp": {"$type": "string"}}, {"timestamp": 1}).limit(STATUS_BATCH_SIZE).to_list(length=None)
+        if not docs:
+            break
+        ops = []
+        for d in docs:
+            ts = parse_iso(d["timestamp"])
+            # Unparseable values are dated now so the TTL index still expires them.
+            ops.append(UpdateOne({"_id": d["_id"]}, {"$set": {"timestamp": as_utc(ts) if ts else datetime.now(timezone.utc)}}))
+        await db.status_checks.bulk_write(ops, ordered=False)
+        migrated += len(ops)
+    if migrated:
+        logger.info(f"status_checks: converted {migrated} legacy string timestamps to dates")
+        await collection_versions.bump("status_checks")
+    return migrated
+
+
+async def update_status_rollups(docs: List[Dict[str, Any]]):
+    counts: Dict[tuple, Dict[str, Any]] = {}
+    for d in docs:
+        ts = d["timestamp"]
+        for bucket in STATUS_ROLLUP_BUCKETS:
+            key = (d["client_name"], bucket, bucket_start(ts, bucket))
+            agg = counts.get(key)
+            if agg is None:
+                counts[key] = {"count": 1, "first_seen": ts, "last_seen": ts}
+            else:
+                agg["count"] += 1
+                agg["first_seen"] = min(agg["first_seen"], ts)
+                agg["last_seen"] = max(agg["last_seen"], ts)
+    ops = []
+    for (client_name, bucket, start), agg in counts.items():
+        ops.append(UpdateOne(
+            {"_id": f"{bucket}|{client_name}|{start.isoformat()}"},
+            {
+                "$setOnInsert": {"client_name": client_name, "bucket": bucket, "start": start},
+                "$inc": {"count": agg["count"]},
+                "$min": {"first_seen": agg["first_seen"]},
+                "$max": {"last_seen": agg["last_seen"]},
+            },
+            upsert=True,
+        ))
+    if ops:
+        await db.status_rollups.bulk_write(ops, ordered=False)
+
+
+async def on_status_flush(docs: List[Dict[str, Any]]):
+    await collection_versions.bump("status_checks")
+    await update_status_rollups(docs)
+
+
+status_buffer = WriteBehindBuffer("status_checks", STATUS_BATCH_SIZE, STATUS_FLUSH_INTERVAL, STATUS_BUFFER_MAX, on_flush=on_status_flush)
+
+
 # ---------- Seed Data ----------
 
 DEFAULT_AGENTS = [
@@ -110,10 +839,16 @@ DEFAULT_AGENTS = [
 ]
 
 
+# Set once the agents collection is known to be non-empty; later calls skip the query.
+agents_seeded = False
+
+
 async def ensure_seed_agents():
+    global agents_seeded
+    if agents_seeded:
+        return
     try:
-        count = await db.agents.count_documents({})
-        if count == 0:
+        if await db.agents.find_one({}, {"_id": 1}) is None:
             now = now_iso()
             docs = []
             for a in DEFAULT_AGENTS:
@@ -130,6 +865,8 @@ async def ensure_seed_agents():
                 })
             if docs:
                 await db.agents.insert_many(docs)
+                await collection_versions.bump("agents")
+        agents_seeded = True
     except Exception as e:
         logger.exception(f"Seeding agents failed: {e}")
 
@@ -146,7 +883,7 @@ def send_n8n(flow: str, payload: Dict[str, Any], custom_base: Optional[str] = No
     if EMERGENT_DRY_RUN:
         return {"ok": True, "dry_run": True, "url": url, "payload": payload}
     try:
-        resp = requests.post(url, json=payload, timeout=REQ_TIMEOUT)
+        resp = http_session.post(url, json=payload, timeout=REQ_TIMEOUT)
         if resp.status_code >= 400:
             raise HTTPException(status_code=resp.status_code, detail=f"n8n error: {resp.text}")
         return {"ok": True, "status": resp.status_code}
@@ -162,7 +899,7 @@ def trigger_url(url: str, payload: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         logger.info(f"n8n_trigger_url ok url={url} dry_run=True")
         return {"ok": True, "dry_run": True, "url": url, "payload": body, "message": "Workflow was started"}
     try:
-        resp = requests.post(url, json=body, timeout=REQ_TIMEOUT)
+        resp = http_session.post(url, json=body, timeout=REQ_TIMEOUT)
         if resp.status_code >= 400:
             raise HTTPException(status_code=resp.status_code, detail=f"n8n error: {resp.text}")
         logger.info(f"n8n_trigger_url ok url={url} status={resp.status_code}")
@@ -182,18 +919,245 @@ async def get_hooks_config() -> HooksConfig:
 
 async def set_hooks_config(cfg: HooksConfig) -> HooksConfig:
     await db.config.update_one({"_id": "webhooks"}, {"$set": cfg.model_dump()}, upsert=True)
+    await collection_versions.bump("webhook_subscriptions")
     return await get_hooks_config()
 
 
-async def emit_event(flow: Optional[str], event: str, data: Dict[str, Any]):
-    if not flow:
-        return {"ok": True, "skipped": True, "reason": "no-flow"}
-    payload = {"event": event, "data": data, "timestamp": now_iso()}
+# ---------- Webhook dispatch ----------
+
+def post_webhook(url: str, payload: Dict[str, Any], timeout: float) -> int:
+    resp = http_session.post(url, json=payload, timeout=timeout)
+    return resp.status_code
+
+
+class WebhookDispatcher:
+    """Fans events out to every matching subscription without blocking the caller.
+
+    Subscriptions and the legacy HooksConfig flows are compiled into an
+    event -> destinations table, rebuilt whenever the webhook_subscriptions
+    version changes. Each destination delivers on its own thread pool of
+    `dest_concurrency` workers, so a slow subscriber only ever ties up its own
+    threads, and holds at most `dest_queue` queued or running deliveries;
+    events past that are dropped and counted in `dropped`.
+    """
+
+    def __init__(self, timeout: float, dest_concurrency: int, dest_queue: int):
+        self.timeout = timeout
+        self.dest_concurrency = max(1, dest_concurrency)
+        self.dest_queue = max(1, dest_queue)
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._queued: Dict[str, int] = {}
+        self.dropped: Dict[str, int] = {}
+        self._table: Dict[str, List[tuple]] = {}
+        self._version: Optional[int] = None
+        self._tasks: set = set()
+
+    async def refresh(self, force: bool = False):
+        version = await collection_versions.get("webhook_subscriptions")
+        if not force and version == self._version:
+            return
+        table: Dict[str, List[tuple]] = {}
+        cfg = await get_hooks_config()
+        for event, flow in (("agent_activation", cfg.activation_flow), ("agent_deactivation", cfg.deactivation_flow), ("status_change", cfg.status_change_flow)):
+            if flow:
+                table.setdefault(event, []).append((n8n_target(flow), None, None))
+        async for sub in db.webhook_subscriptions.find({"enabled": True}, {"_id": 0}):
+            url = sub.get("url") or n8n_target(sub["flow"])
+            agent_ids = frozenset(sub["agent_ids"]) if sub.get("agent_ids") else None
+            sources = frozenset(sub["sources"]) if sub.get("sources") else None
+            table.setdefault(sub["event"], []).append((url, agent_ids, sources))
+        self._table = table
+        self._version = version
+        # Retire idle pools of destinations that are no longer subscribed.
+        live = {url for dests in table.values() for url, _, _ in dests}
+        for url in [u for u in self._executors if u not in live and not self._queued.get(u)]:
+            self._executors.pop(url).shutdown(wait=False)
+
+    def targets(self, event: str, data: Dict[str, Any]) -> List[str]:
+        urls: List[str] = []
+        for url, agent_ids, sources in self._table.get(event, []) + self._table.get("*", []):
+            if agent_ids is not None and data.get("agent_id") not in agent_ids:
+                continue
+            if sources is not None and data.get("source") not in sources:
+                continue
+            if url not in urls:
+                urls.append(url)
+        return urls
+
+    async def dispatch(self, event: str, data: Dict[str, Any]) -> int:
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"webhook table refresh failed, using previous table: {e}")
+        payload = {"event": event, "data": data, "timestamp": now_iso()}
+        queued = 0
+        for url in self.targets(event, data):
+            queued += self._enqueue(url, payload)
+        return queued
+
+    def _enqueue(self, url: str, payload: Dict[str, Any]) -> bool:
+        queued = self._queued.get(url, 0)
+        if queued >= self.dest_queue:
+            self.dropped[url] = self.dropped.get(url, 0) + 1
+            logger.warning(f"webhook queue full url={url}, dropped event={payload['event']} total_dropped={self.dropped[url]}")
+            return False
+        self._queued[url] = queued + 1
+        task = asyncio.create_task(self._deliver(url, payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _deliver(self, url: str, payload: Dict[str, Any]):
+        try:
+            if EMERGENT_DRY_RUN:
+                logger.info(f"webhook dry_run url={url} event={payload['event']}")
+                return
+            executor = self._executors.get(url)
+            if executor is None:
+                executor = self._executors[url] = ThreadPoolExecutor(max_workers=self.dest_concurrency, thread_name_prefix="webhook")
+            # Awaited to the end (bounded by the requests timeout): the queue slot
+            # is only freed once the thread is actually done with the delivery.
+            status = await asyncio.get_running_loop().run_in_executor(executor, post_webhook, url, payload, self.timeout)
+            if status >= 400:
+                logger.warning(f"webhook delivery failed url={url} status={status}")
+        except requests.RequestException as e:
+            logger.warning(f"webhook delivery failed url={url}: {e!r}")
+        finally:
+            self._queued[url] -= 1
+            if not self._queued[url]:
+                del self._queued[url]
+
+    async def drain(self, timeout: float):
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
+
+
+webhook_dispatcher = WebhookDispatcher(WEBHOOK_TIMEOUT, WEBHOOK_DEST_CONCURRENCY, WEBHOOK_DEST_QUEUE)
+
+
+async def emit_event(event: str, data: Dict[str, Any]) -> int:
+    return await webhook_dispatcher.dispatch(event, data)
+
+
+# ---------- Agent state history ----------
+
+async def ensure_agent_history_indexes():
     try:
-        return send_n8n(flow, payload)
-    except HTTPException as e:
-        logger.warning(f"n8n emit failed: {e.detail}")
-        return {"ok": False, "error": e.detail}
+        await db.agent_events.create_index([("source", 1), ("agent_id", 1), ("at", -1)])
+        await db.agent_uptime_daily.create_index([("source", 1), ("agent_id", 1), ("day", 1)])
+    except Exception as e:
+        logger.exception(f"agent history index setup failed: {e}")
+
+
+def day_start(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def split_by_day(start: datetime, end: datetime) -> List[tuple]:
+    parts = []
+    cur = start
+    while cur < end:
+        nxt = min(end, day_start(cur) + timedelta(days=1))
+        parts.append((day_start(cur), (nxt - cur).total_seconds()))
+        cur = nxt
+    return parts
+
+
+async def record_transition(agent_id: str, source: str, to_state: str, trigger: str, at: Optional[datetime] = None):
+    """Append a state transition and fold the closed interval into the daily aggregates.
+
+    No-op when the agent is already in `to_state` for this source.
+    """
+    at = at or datetime.now(timezone.utc)
+    key = f"{source}|{agent_id}"
+    try:
+        prev = await db.agent_state_current.find_one_and_update(
+            {"_id": key, "state": {"$ne": to_state}},
+            {"$set": {"agent_id": agent_id, "source": source, "state": to_state, "since": at}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return None
+    from_state = prev.get("state") if prev else None
+    await db.agent_events.insert_one({
+        "agent_id": agent_id, "source": source, "from_state": from_state,
+        "to_state": to_state, "trigger": trigger, "at": at,
+    })
+    ops = [UpdateOne(
+        {"_id": f"{key}|{day_start(at).date().isoformat()}"},
+        {"$setOnInsert": {"agent_id": agent_id, "source": source, "day": day_start(at)}, "$inc": {"transitions": 1}},
+        upsert=True,
+    )]
+    if from_state == "active" and prev.get("since"):
+        for day, seconds in split_by_day(as_utc(prev["since"]), at):
+            ops.append(UpdateOne(
+                {"_id": f"{key}|{day.date().isoformat()}"},
+                {"$setOnInsert": {"agent_id": agent_id, "source": source, "day": day}, "$inc": {"active_seconds": seconds}},
+                upsert=True,
+            ))
+    await db.agent_uptime_daily.bulk_write(ops, ordered=False)
+    return from_state
+
+
+async def record_transitions(agent_ids: List[str], source: str, to_state: str, trigger: str):
+    at = datetime.now(timezone.utc)
+    results = await asyncio.gather(
+        *(record_transition(a, source, to_state, trigger, at) for a in agent_ids),
+        return_exceptions=True,
+    )
+    for r in results:
+        if isinstance(r, Exception):
+            logger.warning(f"recording transition failed: {r}")
+
+
+async def source_agent_ids(source: str, api_key: Optional[str], header_base: Optional[str]) -> List[str]:
+    """Agent ids a prod/staging bulk operation applies to: the mirror, else the upstream list."""
+    mirror = mirrors.get(source)
+    try:
+        if mirror is not None and mirror.serves(api_key, header_base):
+            return await db.agents_mirror.distinct("agent_id", {"source": source})
+        return [a["agent_id"] for a in await fetch_upstream_agents(api_key, source, header_base) if a.get("agent_id")]
+    except Exception as e:
+        logger.warning(f"listing agents for bulk transition failed source={source}: {e}")
+        return await db.agent_state_current.distinct("agent_id", {"source": source})
+
+
+async def safe_record_transition(agent_id: str, source: str, to_state: str, trigger: str):
+    try:
+        await record_transition(agent_id, source, to_state, trigger)
+    except Exception as e:
+        logger.warning(f"recording transition failed: {e}")
+
+
+async def compute_agent_uptime(agent_id: str, source: str, start: datetime, end: datetime) -> AgentUptime:
+    now = datetime.now(timezone.utc)
+    end = min(end, now)
+    days = await db.agent_uptime_daily.find(
+        {"source": source, "agent_id": agent_id, "day": {"$gte": start, "$lt": end}},
+        {"_id": 0, "active_seconds": 1, "transitions": 1},
+    ).to_list(length=None)
+    active = sum(d.get("active_seconds", 0) for d in days)
+    transitions = sum(d.get("transitions", 0) for d in days)
+    cur = await db.agent_state_current.find_one({"_id": f"{source}|{agent_id}"})
+    state = cur.get("state") if cur else None
+    if state == "active" and cur.get("since"):
+        # The open interval is not folded into the daily aggregates until it closes.
+        active += max(0.0, (end - max(as_utc(cur["since"]), start)).total_seconds())
+    window = max(0.0, (end - start).total_seconds())
+    return AgentUptime(
+        agent_id=agent_id,
+        source=source,
+        state=state,
+        window_start=start,
+        window_end=end,
+        window_seconds=int(window),
+        active_seconds=int(active),
+        availability=round(active / window, 6) if window else 0.0,
+        transitions=transitions,
+    )
 
 
 # ---------- Routes ----------
@@ -203,18 +1167,50 @@ async def root():
     return {"message": "Hello World"}
 
 
+def status_check_doc(status_obj: StatusCheck) -> Dict[str, Any]:
+    # Stored as a BSON date: required by the time-series timeField and TTL index.
+    return status_obj.model_dump()
+
+
+def enqueue_status_checks(status_objs: List[StatusCheck]):
+    if not status_buffer.offer([status_check_doc(s) for s in status_objs]):
+        raise HTTPException(status_code=503, detail="Status ingestion buffer full", headers={"Retry-After": "1"})
+
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.model_dump()
     status_obj = StatusCheck(**status_dict)
-    doc = status_obj.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
-    _ = await db.status_checks.insert_one(doc)
+    enqueue_status_checks([status_obj])
     return status_obj
 
 
+@api_router.post("/status/batch", response_model=List[StatusCheck])
+async def create_status_checks_batch(inputs: List[StatusCheckCreate]):
+    if len(inputs) > STATUS_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {STATUS_BATCH_MAX_ITEMS} items")
+    status_objs = [StatusCheck(**i.model_dump()) for i in inputs]
+    enqueue_status_checks(status_objs)
+    return status_objs
+
+
+@api_router.get("/status/stats", response_model=List[StatusStatsBucket])
+async def get_status_stats(client: Optional[str] = None, bucket: str = "1h", from_: Optional[datetime] = Query(default=None, alias="from"), to: Optional[datetime] = None):
+    if bucket not in STATUS_ROLLUP_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(STATUS_ROLLUP_BUCKETS)}")
+    to = to or datetime.now(timezone.utc)
+    from_ = from_ or (to - timedelta(days=1))
+    query: Dict[str, Any] = {"bucket": bucket, "start": {"$gte": bucket_start(from_, bucket), "$lte": to}}
+    if client:
+        query["client_name"] = client
+    return await db.status_rollups.find(query, {"_id": 0}).sort("start", 1).to_list(length=None)
+
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
+async def get_status_checks(request: Request, response: Response):
+    cached = await not_modified(request, response, "status_checks")
+    if cached:
+        return cached
     status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
     for check in status_checks:
         if isinstance(check.get('timestamp'), str):
@@ -234,21 +1230,21 @@ async def compute_uptime(doc: Dict[str, Any]) -> int:
 
 
 def parse_agent(doc: Dict[str, Any]) -> Agent:
-    parsed = dict(doc)
-    for k in ["created_at", "updated_at", "activated_at", "last_heartbeat"]:
-        if isinstance(parsed.get(k), str):
-            parsed[k] = parse_iso(parsed[k])
+    def ts(k: str):
+        v = doc.get(k)
+        return parse_iso(v) if isinstance(v, str) else v
+
     return Agent(
-        agent_id=parsed["agent_id"],
-        name=parsed.get("name", parsed["agent_id"].capitalize()),
-        image=parsed.get("image"),
-        env=parsed.get("env", {}),
-        state=parsed.get("state", "sleep"),
-        uptime=parsed.get("uptime", 0),
-        created_at=parsed.get("created_at") or datetime.now(timezone.utc),
-        updated_at=parsed.get("updated_at") or datetime.now(timezone.utc),
-        activated_at=parsed.get("activated_at"),
-        last_heartbeat=parsed.get("last_heartbeat"),
+        agent_id=doc["agent_id"],
+        name=doc.get("name", doc["agent_id"].capitalize()),
+        image=doc.get("image"),
+        env=doc.get("env", {}),
+        state=doc.get("state", "sleep"),
+        uptime=doc.get("uptime", 0),
+        created_at=ts("created_at") or datetime.now(timezone.utc),
+        updated_at=ts("updated_at") or datetime.now(timezone.utc),
+        activated_at=ts("activated_at"),
+        last_heartbeat=ts("last_heartbeat"),
     )
 
 
@@ -260,15 +1256,18 @@ def resolve_base_from_header(source: str, header_base: Optional[str]) -> str:
     return BLAXING_API_BASE
 
 
-def forward_blaxing(method: str, path: str, api_key: Optional[str], source: str, header_base: Optional[str], json: Optional[dict] = None):
+def blaxing_target(path: str, api_key: Optional[str], source: str, header_base: Optional[str]) -> tuple:
     key = api_key or os.environ.get("BLA_API_KEY")
     if not key:
         raise HTTPException(status_code=401, detail="X-API-KEY required for prod/staging mode")
     base = resolve_base_from_header(source, header_base)
-    url = f"{base}{path}"
-    headers = {"X-API-KEY": key}
+    return f"{base}{path}", {"X-API-KEY": key}
+
+
+def forward_blaxing(method: str, path: str, api_key: Optional[str], source: str, header_base: Optional[str], json: Optional[dict] = None):
+    url, headers = blaxing_target(path, api_key, source, header_base)
     try:
-        resp = requests.request(method, url, json=json, headers=headers, timeout=REQ_TIMEOUT)
+        resp = http_session.request(method, url, json=json, headers=headers, timeout=REQ_TIMEOUT)
         if resp.status_code >= 400:
             raise HTTPException(status_code=resp.status_code, detail=resp.text)
         return resp.json() if resp.text else {}
@@ -278,50 +1277,572 @@ def forward_blaxing(method: str, path: str, api_key: Optional[str], source: str,
         raise HTTPException(status_code=502, detail=f"Upstream error: {str(e)}")
 
 
+def open_blaxing_stream(path: str, api_key: Optional[str], source: str, header_base: Optional[str]) -> requests.Response:
+    url, headers = blaxing_target(path, api_key, source, header_base)
+    try:
+        resp = http_session.get(url, headers=headers, timeout=REQ_TIMEOUT, stream=True)
+    except requests.Timeout:
+        raise HTTPException(status_code=504, detail="Upstream timeout")
+    except requests.RequestException as e:
+        raise HTTPException(status_code=502, detail=f"Upstream error: {str(e)}")
+    if resp.status_code >= 400:
+        detail = resp.text
+        resp.close()
+        raise HTTPException(status_code=resp.status_code, detail=detail)
+    return resp
+
+
+class JsonArrayStream:
+    """Incrementally decodes the items of a top-level JSON array fed as byte chunks."""
+
+    _ws = re.compile(r"\s*")
+    _delim = re.compile(r"[\s,\]]")
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._state = "start"  # start -> first -> (sep <-> item) -> done
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        self._buf += self._text.decode(chunk)
+        return self._drain(final=False)
+
+    def close(self) -> List[Any]:
+        self._buf += self._text.decode(b"", final=True)
+        items = self._drain(final=True)
+        if self._state == "start":
+            # Empty body: nothing upstream.
+            self._state = "done"
+        if self._state != "done":
+            raise ValueError("truncated JSON array")
+        if self._buf.strip():
+            raise ValueError("trailing data after JSON array")
+        return items
+
+    def _drain(self, final: bool) -> List[Any]:
+        items: List[Any] = []
+        buf, pos = self._buf, 0
+        while self._state != "done":
+            pos = self._ws.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            ch = buf[pos]
+            if self._state == "start":
+                if ch != "[":
+                    raise ValueError("expected a JSON array")
+                self._state, pos = "first", pos + 1
+            elif self._state == "sep" or (self._state == "first" and ch == "]"):
+                if ch == "]":
+                    self._state, pos = "done", pos + 1
+                elif ch == ",":
+                    self._state, pos = "item", pos + 1
+                else:
+                    raise ValueError(f"unexpected {ch!r} in JSON array")
+            else:
+                try:
+                    item, end = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    break
+                if not isinstance(item, (dict, list, str)):
+                    # Numbers and literals have no closing token: "1." may still become
+                    # "1.5", so only accept one that is followed by a real delimiter.
+                    delim = self._delim.search(buf, pos)
+                    if delim is None and not final:
+                        break
+                    token_end = delim.start() if delim else len(buf)
+                    if end != token_end:
+                        raise ValueError(f"invalid value {buf[pos:token_end]!r} in JSON array")
+                items.append(item)
+                self._state, pos = "sep", end
+        self._buf = buf[pos:]
+        return items
+
+
+async def iter_upstream_items(path: str, api_key: Optional[str], source: str, header_base: Optional[str]):
+    """Yield raw items of an upstream JSON array without holding the whole body."""
+    resp = await asyncio.to_thread(open_blaxing_stream, path, api_key, source, header_base)
+    try:
+        parser = JsonArrayStream()
+        chunks = resp.iter_content(chunk_size=UPSTREAM_STREAM_CHUNK)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            for item in parser.feed(chunk):
+                yield item
+        for item in parser.close():
+            yield item
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=f"Upstream error: invalid JSON array ({e})")
+    except requests.Timeout:
+        raise HTTPException(status_code=504, detail="Upstream timeout")
+    except requests.RequestException as e:
+        raise HTTPException(status_code=502, detail=f"Upstream error: {str(e)}")
+    finally:
+        resp.close()
+
+
+def normalize_upstream_agent(it: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "agent_id": it.get("agent_id") or it.get("id") or it.get("name"),
+        "name": it.get("name") or (it.get("agent_id") or "").capitalize(),
+        "image": it.get("image"),
+        "env": it.get("env") or {},
+        "state": it.get("state", "sleep"),
+        "uptime": it.get("uptime", 0),
+        "created_at": it.get("created_at") or now_iso(),
+        "updated_at": it.get("updated_at") or now_iso(),
+        "activated_at": it.get("activated_at"),
+        "last_heartbeat": it.get("last_heartbeat"),
+    }
+
+
+# ---- Agent list paging ----
+
+class AgentPage(BaseModel):
+    state: Optional[str] = None
+    image: Optional[str] = None
+    name_prefix: Optional[str] = None
+    sort: str = "agent_id"
+    limit: int = AGENTS_PAGE_DEFAULT
+    cursor: Optional[str] = None
+
+    @property
+    def sort_field(self) -> str:
+        return self.sort.lstrip("-")
+
+    @property
+    def descending(self) -> bool:
+        return self.sort.startswith("-")
+
+    def variant(self) -> str:
+        return self.model_dump_json()
+
+
+def encode_cursor(page: AgentPage, last: Dict[str, Any]) -> str:
+    raw = json.dumps([page.sort, last.get(page.sort_field), last.get("agent_id")], default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(page: AgentPage) -> Optional[tuple]:
+    if not page.cursor:
+        return None
+    try:
+        padded = page.cursor + "=" * (-len(page.cursor) % 4)
+        sort, value, agent_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if sort != page.sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+    return value, agent_id
+
+
+def agent_page_query(page: AgentPage) -> tuple:
+    """Build the Mongo filter and sort for one keyset page; agent_id breaks ties."""
+    query: Dict[str, Any] = {}
+    if page.state:
+        query["state"] = page.state
+    if page.image:
+        query["image"] = page.image
+    if page.name_prefix:
+        query["name"] = {"$regex": "^" + re.escape(page.name_prefix)}
+    field = page.sort_field
+    op = "$lt" if page.descending else "$gt"
+    after = decode_cursor(page)
+    if after is not None:
+        value, agent_id = after
+        keyset = {"agent_id": {op: agent_id}} if field == "agent_id" else {
+            "$or": [{field: {op: value}}, {field: value, "agent_id": {op: agent_id}}]
+        }
+        query = {"$and": [query, keyset]} if query else keyset
+    direction = -1 if page.descending else 1
+    sort = [("agent_id", direction)] if field == "agent_id" else [(field, direction), ("agent_id", direction)]
+    return query, sort
+
+
+def page_in_memory(items: List[Dict[str, Any]], page: AgentPage) -> List[Dict[str, Any]]:
+    """Same semantics as agent_page_query, for lists that are not in Mongo."""
+    field = page.sort_field
+
+    def sort_key(d: Dict[str, Any]) -> tuple:
+        return (d.get(field) or "", d.get("agent_id") or "")
+
+    after = decode_cursor(page)
+    out = []
+    for it in items:
+        if page.state and it.get("state") != page.state:
+            continue
+        if page.image and it.get("image") != page.image:
+            continue
+        if page.name_prefix and not (it.get("name") or "").startswith(page.name_prefix):
+            continue
+        if after is not None:
+            key, bound = sort_key(it), (after[0] or "", after[1] or "")
+            if (key <= bound) if not page.descending else (key >= bound):
+                continue
+        out.append(it)
+    out.sort(key=sort_key, reverse=page.descending)
+    return out[:page.limit + 1]
+
+
+async def ensure_agent_list_indexes():
+    try:
+        await db.agents.create_index("agent_id")
+        await db.agents.create_index([("state", 1), ("agent_id", 1)])
+        for field in AGENT_SORT_FIELDS[1:]:
+            await db.agents.create_index([(field, 1), ("agent_id", 1)])
+            await db.agents.create_index([("state", 1), (field, 1), ("agent_id", 1)])
+        await db.agents_mirror.create_index([("source", 1), ("state", 1), ("agent_id", 1)])
+        for field in AGENT_SORT_FIELDS[1:]:
+            await db.agents_mirror.create_index([("source", 1), (field, 1), ("agent_id", 1)])
+            await db.agents_mirror.create_index([("source", 1), ("state", 1), (field, 1), ("agent_id", 1)])
+    except Exception as e:
+        logger.exception(f"agent list index setup failed: {e}")
+
+
+# LRU of (expires, items); keys come from client headers, so it is small and bounded.
+upstream_list_cache: OrderedDict = OrderedDict()
+
+
+async def fetch_upstream_agents(api_key: Optional[str], source: str, header_base: Optional[str]) -> List[Dict[str, Any]]:
+    """Normalized upstream agent list, cached briefly so paging doesn't refetch it per page."""
+    key = hashlib.sha1(f"{source}|{header_base or ''}|{api_key or ''}".encode()).hexdigest()
+    now = time.monotonic()
+    cached = upstream_list_cache.get(key)
+    if cached and cached[0] > now:
+        upstream_list_cache.move_to_end(key)
+        return cached[1]
+    items = [normalize_upstream_agent(it) async for it in iter_upstream_items("/agents/list", api_key, source, header_base)]
+    now = time.monotonic()
+    for k in [k for k, (expires, _) in upstream_list_cache.items() if expires <= now]:
+        del upstream_list_cache[k]
+    upstream_list_cache[key] = (now + AGENTS_PROXY_CACHE_TTL, items)
+    upstream_list_cache.move_to_end(key)
+    while len(upstream_list_cache) > AGENTS_PROXY_CACHE_SIZE:
+        upstream_list_cache.popitem(last=False)
+    return items
+
+
+def finish_page(items: List[Dict[str, Any]], page: AgentPage, response: Response) -> List[Dict[str, Any]]:
+    if len(items) > page.limit:
+        items = items[:page.limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(page, items[-1])
+    return items
+
+
+# ---- Upstream mirror ----
+
+class UpstreamMirror:
+    """Polls one upstream source and keeps db.agents_mirror in sync with it.
+
+    Only agents whose upstream payload changed since the previous poll are
+    written, in a single bulk_write.
+    """
+
+    def __init__(self, source: str, interval: float):
+        self.source = source
+        self.interval = interval
+        self.synced_at: Optional[datetime] = None
+        self._hashes: Optional[Dict[str, str]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"mirror sync failed source={self.source}: {e}")
+                try:
+                    await db.mirror_status.update_one({"_id": self.source}, {"$set": {"ok": False, "error": str(e), "checked_at": now_iso()}}, upsert=True)
+                except Exception as status_error:
+                    # Mongo itself may be down; keep polling rather than ending the worker.
+                    logger.warning(f"mirror status write failed source={self.source}: {status_error}")
+            await asyncio.sleep(self.interval)
+
+    async def load(self):
+        self._hashes = {}
+        async for d in db.agents_mirror.find({"source": self.source}, {"agent_id": 1, "hash": 1}):
+            self._hashes[d["agent_id"]] = d.get("hash")
+        status = await db.mirror_status.find_one({"_id": self.source})
+        if status and status.get("synced_at") and self._hashes:
+            self.synced_at = as_utc(status["synced_at"])
+
+    async def sync(self) -> int:
+        if self._hashes is None:
+            await self.load()
+        seen: Dict[str, str] = {}
+        ops = []
+        async for it in iter_upstream_items("/agents/list", None, self.source, None):
+            doc = normalize_upstream_agent(it)
+            agent_id = doc["agent_id"]
+            if not agent_id:
+                continue
+            digest = hashlib.sha1(json.dumps(it, sort_keys=True, default=str).encode()).hexdigest()
+            seen[agent_id] = digest
+            if self._hashes.get(agent_id) != digest:
+                doc.update({"source": self.source, "hash": digest})
+                ops.append(UpdateOne({"_id": f"{self.source}|{agent_id}"}, {"$set": doc}, upsert=True))
+        for agent_id in self._hashes.keys() - seen.keys():
+            ops.append(DeleteOne({"_id": f"{self.source}|{agent_id}"}))
+        if ops:
+            await db.agents_mirror.bulk_write(ops, ordered=False)
+            await collection_versions.bump(f"agents_mirror:{self.source}")
+        self._hashes = seen
+        self.synced_at = datetime.now(timezone.utc)
+        await db.mirror_status.update_one(
+            {"_id": self.source},
+            {"$set": {"ok": True, "error": None, "synced_at": self.synced_at, "checked_at": now_iso(), "changed": len(ops)}},
+            upsert=True,
+        )
+        return len(ops)
+
+    def serves(self, api_key: Optional[str], header_base: Optional[str]) -> bool:
+        """Whether a read with these headers may be answered from the mirror.
+
+        The mirror is synced with BLA_API_KEY, which is also what a request
+        without X-API-KEY is proxied with. Any other key is proxied live so
+        upstream still decides (a rejected key falls back to mock data), and a
+        custom base points at a different upstream altogether.
+        """
+        if self.synced_at is None or header_base:
+            return False
+        if not api_key:
+            return True
+        return hmac.compare_digest(api_key.encode(), (os.environ.get("BLA_API_KEY") or "").encode())
+
+    def data_age(self) -> Optional[float]:
+        if self.synced_at is None:
+            return None
+        return (datetime.now(timezone.utc) - self.synced_at).total_seconds()
+
+
+mirrors: Dict[str, UpstreamMirror] = {
+    src: UpstreamMirror(src, BLAXING_MIRROR_INTERVAL) for src in BLAXING_MIRROR_SOURCES if src in ("prod", "staging")
+}
+
+
+async def start_mirrors():
+    if not mirrors:
+        return
+    try:
+        await db.agents_mirror.create_index([("source", 1), ("agent_id", 1)])
+    except Exception as e:
+        logger.exception(f"mirror index setup failed: {e}")
+    for m in mirrors.values():
+        try:
+            # Serve the persisted mirror right away instead of waiting for the first poll.
+            await m.load()
+        except Exception as e:
+            logger.warning(f"mirror load failed source={m.source}: {e}")
+        m.start()
+
+
+async def stop_mirrors():
+    for m in mirrors.values():
+        await m.stop()
+
+
 @api_router.get("/agents/list", response_model=List[Agent])
-async def list_agents(x_blaxing_source: Optional[str] = Header(default="mock"), x_api_key: Optional[str] = Header(default=None), x_blaxing_base: Optional[str] = Header(default=None)):
+async def list_agents(
+    request: Request,
+    response: Response,
+    state: Optional[str] = None,
+    image: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    sort: str = Query(default="agent_id", pattern="^-?(" + "|".join(AGENT_SORT_FIELDS) + ")$"),
+    limit: int = Query(default=AGENTS_PAGE_DEFAULT, ge=1, le=AGENTS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    x_blaxing_source: Optional[str] = Header(default="mock"),
+    x_api_key: Optional[str] = Header(default=None),
+    x_blaxing_base: Optional[str] = Header(default=None),
+):
+    page = AgentPage(state=state, image=image, name_prefix=name_prefix, sort=sort, limit=limit, cursor=cursor)
     src = (x_blaxing_source or "mock").lower()
+    mirror = mirrors.get(src)
+    if mirror is not None and mirror.serves(x_api_key, x_blaxing_base):
+        cached = await not_modified(request, response, f"agents_mirror:{src}", page.variant())
+        if cached:
+            return cached
+        query, order = agent_page_query(page)
+        query = {"$and": [{"source": src}, query]} if query else {"source": src}
+        items = await db.agents_mirror.find(query, {"_id": 0, "source": 0, "hash": 0}).sort(order).limit(page.limit + 1).to_list(length=None)
+        response.headers["X-Data-Age"] = str(int(mirror.data_age()))
+        return [parse_agent(it) for it in finish_page(items, page, response)]
     if src in ("prod", "staging"):
         try:
-            data = forward_blaxing("GET", "/agents/list", x_api_key, src, x_blaxing_base)
-            items = []
-            for it in data or []:
-                items.append(parse_agent({
-                    "agent_id": it.get("agent_id") or it.get("id") or it.get("name"),
-                    "name": it.get("name") or (it.get("agent_id") or "").capitalize(),
-                    "image": it.get("image"),
-                    "env": it.get("env") or {},
-                    "state": it.get("state", "sleep"),
-                    "uptime": it.get("uptime", 0),
-                    "created_at": it.get("created_at") or now_iso(),
-                    "updated_at": it.get("updated_at") or now_iso(),
-                    "activated_at": it.get("activated_at"),
-                    "last_heartbeat": it.get("last_heartbeat"),
-                }))
-            return items
+            items = await fetch_upstream_agents(x_api_key, src, x_blaxing_base)
+            return [parse_agent(it) for it in finish_page(page_in_memory(items, page), page, response)]
         except HTTPException:
             pass
+    cached = await not_modified(request, response, "agents", page.variant())
+    if cached:
+        return cached
     await ensure_seed_agents()
-    items = await db.agents.find({}, {"_id": 0}).to_list(length=None)
+    query, order = agent_page_query(page)
+    items = await db.agents.find(query, {"_id": 0}).sort(order).limit(page.limit + 1).to_list(length=None)
     result: List[Agent] = []
-    for it in items:
+    for it in finish_page(items, page, response):
         it = dict(it)
         it["uptime"] = await compute_uptime(it)
         result.append(parse_agent(it))
     return result
 
 
+async def stream_json_array(agents):
+    yield b"["
+    first = True
+    async for agent in agents:
+        yield (b"" if first else b",") + agent.model_dump_json().encode()
+        first = False
+    yield b"]"
+
+
+async def mongo_agents(collection, query: Dict[str, Any], with_uptime: bool):
+    async for doc in collection.find(query, {"_id": 0, "source": 0, "hash": 0}).sort("agent_id", 1).batch_size(500):
+        if with_uptime:
+            doc["uptime"] = await compute_uptime(doc)
+        yield parse_agent(doc)
+
+
+async def upstream_agents(first: Optional[Dict[str, Any]], items):
+    if first is not None:
+        yield parse_agent(normalize_upstream_agent(first))
+    async for it in items:
+        yield parse_agent(normalize_upstream_agent(it))
+
+
+@api_router.get("/agents/stream", response_model=List[Agent])
+async def stream_agents(x_blaxing_source: Optional[str] = Header(default="mock"), x_api_key: Optional[str] = Header(default=None), x_blaxing_base: Optional[str] = Header(default=None)):
+    """Full agent list as a streamed JSON array; memory stays flat regardless of fleet size."""
+    src = (x_blaxing_source or "mock").lower()
+    headers: Dict[str, str] = {}
+    mirror = mirrors.get(src)
+    if mirror is not None and mirror.serves(x_api_key, x_blaxing_base):
+        headers["X-Data-Age"] = str(int(mirror.data_age()))
+        agents = mongo_agents(db.agents_mirror, {"source": src}, with_uptime=False)
+    else:
+        agents = None
+        if src in ("prod", "staging"):
+            items = iter_upstream_items("/agents/list", x_api_key, src, x_blaxing_base)
+            # Pull the first item before responding so upstream failures fall back like list_agents.
+            try:
+                agents = upstream_agents(await items.__anext__(), items)
+            except StopAsyncIteration:
+                agents = upstream_agents(None, items)
+            except HTTPException:
+                pass
+        if agents is None:
+            await ensure_seed_agents()
+            agents = mongo_agents(db.agents, {}, with_uptime=True)
+    return StreamingResponse(stream_json_array(agents), media_type="application/json", headers=headers)
+
+
+async def load_source_agents(src: str, api_key: Optional[str]) -> tuple:
+    """Agents of one source as (docs, data_age); the mirror is preferred over a live fetch."""
+    if src == "mock":
+        await ensure_seed_agents()
+        return await db.agents.find({}, {"_id": 0}).to_list(length=None), None
+    mirror = mirrors.get(src)
+    if mirror is not None and mirror.serves(api_key, None):
+        docs = await db.agents_mirror.find({"source": src}, {"_id": 0, "source": 0, "hash": 0}).to_list(length=None)
+        return docs, int(mirror.data_age())
+    return await fetch_upstream_agents(api_key, src, None), None
+
+
+async def timed_source(src: str, api_key: Optional[str], timeout: float) -> tuple:
+    started = time.monotonic()
+    try:
+        docs, age = await asyncio.wait_for(load_source_agents(src, api_key), timeout=timeout)
+        result = SourceResult(ok=True, count=len(docs), elapsed_ms=int((time.monotonic() - started) * 1000), data_age=age)
+        return result, docs
+    except asyncio.TimeoutError:
+        error = f"timed out after {timeout}s"
+    except HTTPException as e:
+        error = f"{e.status_code}: {e.detail}"
+    except Exception as e:
+        error = str(e)
+    return SourceResult(ok=False, elapsed_ms=int((time.monotonic() - started) * 1000), error=error), []
+
+
+def merge_overview(results: Dict[str, tuple]) -> List[AgentOverviewEntry]:
+    ok_sources = [src for src, (res, _) in results.items() if res.ok]
+    merged: Dict[str, Dict[str, AgentSourceState]] = {}
+    for src in ok_sources:
+        for doc in results[src][1]:
+            agent = parse_agent(doc)
+            merged.setdefault(agent.agent_id, {})[src] = AgentSourceState(
+                state=agent.state, name=agent.name, image=agent.image, updated_at=agent.updated_at,
+            )
+    entries = []
+    for agent_id in sorted(merged):
+        per_source = merged[agent_id]
+        missing = [src for src in ok_sources if src not in per_source]
+        states = {st.state for st in per_source.values()}
+        images = {st.image for st in per_source.values()}
+        entries.append(AgentOverviewEntry(
+            agent_id=agent_id,
+            sources=per_source,
+            missing_in=missing,
+            drift=bool(missing) or len(states) > 1 or len(images) > 1,
+        ))
+    return entries
+
+
+@api_router.get("/agents/overview", response_model=AgentsOverview)
+async def agents_overview(
+    sources: str = ",".join(OVERVIEW_SOURCES),
+    timeout: float = Query(default=OVERVIEW_SOURCE_TIMEOUT, gt=0, le=REQ_TIMEOUT),
+    x_api_key: Optional[str] = Header(default=None),
+):
+    """Agents of several sources side by side; sources are queried concurrently, each with its own deadline."""
+    wanted = [src.strip().lower() for src in sources.split(",") if src.strip()]
+    unknown = [src for src in wanted if src not in OVERVIEW_SOURCES]
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail=f"sources must be a subset of {', '.join(OVERVIEW_SOURCES)}")
+    wanted = list(dict.fromkeys(wanted))
+    fetched = await asyncio.gather(*(timed_source(src, x_api_key, timeout) for src in wanted))
+    results = dict(zip(wanted, fetched))
+    return AgentsOverview(
+        sources={src: res for src, (res, _) in results.items()},
+        agents=merge_overview(results),
+    )
+
+
+@api_router.get("/ready")
+async def ready():
+    if not warmup["ready"]:
+        return JSONResponse({"status": "warming", **warmup}, status_code=503)
+    return {"status": "ready", **warmup}
+
+
 @api_router.get("/health")
 async def health(x_blaxing_source: Optional[str] = Header(default="mock"), x_api_key: Optional[str] = Header(default=None), x_blaxing_base: Optional[str] = Header(default=None)):
     src = (x_blaxing_source or "mock").lower()
     if src in ("prod", "staging"):
-        data = forward_blaxing("GET", "/health", x_api_key, src, x_blaxing_base)
+        data = await asyncio.to_thread(forward_blaxing, "GET", "/health", x_api_key, src, x_blaxing_base)
         return {"status": data.get("status", "ok"), "source": src}
     return {"status": "ok", "source": "mock"}
 
 
 @api_router.post("/agents/register", response_model=Agent)
-async def register_agent(payload: AgentCreate, x_blaxing_source: Optional[str] = Header(default="mock"), x_api_key: Optional[str] = Header(default=None), x_blaxing_base: Optional[str] = Header(default=None)):
+@idempotent
+async def register_agent(payload: AgentCreate, x_blaxing_source: Optional[str] = Header(default="mock"), x_api_key: Optional[str] = Header(default=None), x_blaxing_base: Optional[str] = Header(default=None), idempotency_key: Optional[str] = Header(default=None)):
     src = (x_blaxing_source or "mock").lower()
     if src in ("prod", "staging"):
         if EMERGENT_DRY_RUN:
@@ -337,7 +1858,7 @@ async def register_agent(payload: AgentCreate, x_blaxing_source: Optional[str] =
                 "last_heartbeat": None,
                 "uptime": 0,
             })
-        data = forward_blaxing("POST", "/agents/register", x_api_key, src, x_blaxing_base, json=payload.model_dump())
+        data = await asyncio.to_thread(forward_blaxing, "POST", "/agents/register", x_api_key, src, x_blaxing_base, json=payload.model_dump())
         doc = {
             "agent_id": data.get("agent_id") or payload.agent_id,
             "name": data.get("name") or payload.name or payload.agent_id.capitalize(),
@@ -350,6 +1871,7 @@ async def register_agent(payload: AgentCreate, x_blaxing_source: Optional[str] =
             "last_heartbeat": data.get("last_heartbeat"),
             "uptime": data.get("uptime", 0),
         }
+        await safe_record_transition(doc["agent_id"], src, doc["state"], "register")
         return parse_agent(doc)
 
     existing = await db.agents.find_one({"agent_id": payload.agent_id}, {"_id": 0})
@@ -366,6 +1888,8 @@ async def register_agent(payload: AgentCreate, x_blaxing_source: Optional[str] =
         "last_heartbeat": None,
     }
     await db.agents.update_one({"agent_id": payload.agent_id}, {"$set": base_doc}, upsert=True)
+    await collection_versions.bump("agents")
+    await safe_record_transition(payload.agent_id, "mock", "sleep", "register")
     doc = await db.agents.find_one({"agent_id": payload.agent_id}, {"_id": 0})
     doc = dict(doc)
     doc["uptime"] = await compute_uptime(doc)
@@ -405,16 +1929,20 @@ async def core_router_route(body: CoreRouteRequest):
 
 
 @api_router.post("/agents/activate-all")
-async def activate_all(x_blaxing_source: Optional[str] = Header(default="mock"), x_api_key: Optional[str] = Header(default=None), x_blaxing_base: Optional[str] = Header(default=None)):
+@idempotent
+async def activate_all(x_blaxing_source: Optional[str] = Header(default="mock"), x_api_key: Optional[str] = Header(default=None), x_blaxing_base: Optional[str] = Header(default=None), idempotency_key: Optional[str] = Header(default=None)):
     src = (x_blaxing_source or "mock").lower()
     if src in ("prod", "staging"):
         if EMERGENT_DRY_RUN:
             return {"ok": True, "dry_run": True, "action": "activate-all"}
-        _ = forward_blaxing("POST", "/agents/activate-all", x_api_key, src, x_blaxing_base)
+        _ = await asyncio.to_thread(forward_blaxing, "POST", "/agents/activate-all", x_api_key, src, x_blaxing_base)
+        await record_transitions(await source_agent_ids(src, x_api_key, x_blaxing_base), src, "active", "activate-all")
         return {"ok": True, "action": "activate-all"}
     await ensure_seed_agents()
     now = now_iso()
     res = await db.agents.update_many({}, {"$set": {"state": "active", "activated_at": now, "updated_at": now}})
+    await collection_versions.bump("agents")
+    await record_transitions(await db.agents.distinct("agent_id"), "mock", "active", "activate-all")
     return {"ok": True, "updated": res.modified_count, "state": "active"}
 
 
@@ -424,25 +1952,28 @@ async def deactivate_all(x_blaxing_source: Optional[str] = Header(default="mock"
     if src in ("prod", "staging"):
         if EMERGENT_DRY_RUN:
             return {"ok": True, "dry_run": True, "action": "deactivate-all"}
-        _ = forward_blaxing("POST", "/agents/deactivate-all", x_api_key, src, x_blaxing_base)
+        _ = await asyncio.to_thread(forward_blaxing, "POST", "/agents/deactivate-all", x_api_key, src, x_blaxing_base)
+        await record_transitions(await source_agent_ids(src, x_api_key, x_blaxing_base), src, "sleep", "deactivate-all")
         return {"ok": True, "action": "deactivate-all"}
     await ensure_seed_agents()
     now = now_iso()
     res = await db.agents.update_many({}, {"$set": {"state": "sleep", "updated_at": now}})
+    await collection_versions.bump("agents")
+    await record_transitions(await db.agents.distinct("agent_id"), "mock", "sleep", "deactivate-all")
     return {"ok": True, "updated": res.modified_count, "state": "sleep"}
 
 
 @api_router.post("/agents/{agent_id}/activate")
-async def activate_agent(agent_id: str, x_blaxing_source: Optional[str] = Header(default="mock"), x_api_key: Optional[str] = Header(default=None), x_blaxing_base: Optional[str] = Header(default=None)):
+@idempotent
+async def activate_agent(agent_id: str, x_blaxing_source: Optional[str] = Header(default="mock"), x_api_key: Optional[str] = Header(default=None), x_blaxing_base: Optional[str] = Header(default=None), idempotency_key: Optional[str] = Header(default=None)):
     src = (x_blaxing_source or "mock").lower()
     if src in ("prod", "staging"):
         if EMERGENT_DRY_RUN:
-            cfg = await get_hooks_config()
-            await emit_event(cfg.activation_flow, "agent_activation", {"agent_id": agent_id, "source": src})
+            await emit_event("agent_activation", {"agent_id": agent_id, "source": src})
             return {"ok": True, "dry_run": True, "agent_id": agent_id, "state": "active"}
-        _ = forward_blaxing("POST", f"/agents/{agent_id}/activate", x_api_key, src, x_blaxing_base)
-        cfg = await get_hooks_config()
-        await emit_event(cfg.activation_flow, "agent_activation", {"agent_id": agent_id, "source": src})
+        _ = await asyncio.to_thread(forward_blaxing, "POST", f"/agents/{agent_id}/activate", x_api_key, src, x_blaxing_base)
+        await safe_record_transition(agent_id, src, "active", "activate")
+        await emit_event("agent_activation", {"agent_id": agent_id, "source": src})
         return {"ok": True, "agent_id": agent_id, "state": "active"}
 
     doc = await db.agents.find_one({"agent_id": agent_id}, {"_id": 0})
@@ -450,8 +1981,9 @@ async def activate_agent(agent_id: str, x_blaxing_source: Optional[str] = Header
         raise HTTPException(status_code=404, detail="Agent not found")
     now = now_iso()
     await db.agents.update_one({"agent_id": agent_id}, {"$set": {"state": "active", "activated_at": now, "updated_at": now}})
-    cfg = await get_hooks_config()
-    await emit_event(cfg.activation_flow, "agent_activation", {"agent_id": agent_id, "source": "mock"})
+    await collection_versions.bump("agents")
+    await safe_record_transition(agent_id, "mock", "active", "activate")
+    await emit_event("agent_activation", {"agent_id": agent_id, "source": "mock"})
     return {"ok": True, "agent_id": agent_id, "state": "active"}
 
 
@@ -460,12 +1992,11 @@ async def deactivate_agent(agent_id: str, x_blaxing_source: Optional[str] = Head
     src = (x_blaxing_source or "mock").lower()
     if src in ("prod", "staging"):
         if EMERGENT_DRY_RUN:
-            cfg = await get_hooks_config()
-            await emit_event(cfg.deactivation_flow, "agent_deactivation", {"agent_id": agent_id, "source": src})
+            await emit_event("agent_deactivation", {"agent_id": agent_id, "source": src})
             return {"ok": True, "dry_run": True, "agent_id": agent_id, "state": "sleep"}
-        _ = forward_blaxing("POST", f"/agents/{agent_id}/deactivate", x_api_key, src, x_blaxing_base)
-        cfg = await get_hooks_config()
-        await emit_event(cfg.deactivation_flow, "agent_deactivation", {"agent_id": agent_id, "source": src})
+        _ = await asyncio.to_thread(forward_blaxing, "POST", f"/agents/{agent_id}/deactivate", x_api_key, src, x_blaxing_base)
+        await safe_record_transition(agent_id, src, "sleep", "deactivate")
+        await emit_event("agent_deactivation", {"agent_id": agent_id, "source": src})
         return {"ok": True, "agent_id": agent_id, "state": "sleep"}
 
     doc = await db.agents.find_one({"agent_id": agent_id}, {"_id": 0})
@@ -473,8 +2004,9 @@ async def deactivate_agent(agent_id: str, x_blaxing_source: Optional[str] = Head
         raise HTTPException(status_code=404, detail="Agent not found")
     now = now_iso()
     await db.agents.update_one({"agent_id": agent_id}, {"$set": {"state": "sleep", "updated_at": now}})
-    cfg = await get_hooks_config()
-    await emit_event(cfg.deactivation_flow, "agent_deactivation", {"agent_id": agent_id, "source": "mock"})
+    await collection_versions.bump("agents")
+    await safe_record_transition(agent_id, "mock", "sleep", "deactivate")
+    await emit_event("agent_deactivation", {"agent_id": agent_id, "source": "mock"})
     return {"ok": True, "agent_id": agent_id, "state": "sleep"}
 
 
@@ -483,14 +2015,14 @@ async def agent_status(agent_id: str, x_blaxing_source: Optional[str] = Header(d
     src = (x_blaxing_source or "mock").lower()
     if src in ("prod", "staging"):
         try:
-            data = forward_blaxing("GET", f"/agents/{agent_id}/status", x_api_key, src, x_blaxing_base)
+            data = await asyncio.to_thread(forward_blaxing, "GET", f"/agents/{agent_id}/status", x_api_key, src, x_blaxing_base)
             state = data.get("state", "sleep")
             uptime = int(data.get("uptime", 0)) if str(data.get("uptime", "0")).isdigit() else 0
             cached = await db.agent_state_cache.find_one({"agent_id": agent_id}, {"_id": 0})
             if not cached or cached.get("state") != state:
                 await db.agent_state_cache.update_one({"agent_id": agent_id}, {"$set": {"state": state, "updated_at": now_iso()}}, upsert=True)
-                cfg = await get_hooks_config()
-                await emit_event(cfg.status_change_flow, "status_change", {"agent_id": agent_id, "state": state, "source": src})
+                await safe_record_transition(agent_id, src, state, "status_change")
+                await emit_event("status_change", {"agent_id": agent_id, "state": state, "source": src})
             return {"agent_id": agent_id, "state": state, "uptime": uptime, "status": data.get("status", "ok")}
         except HTTPException:
             pass
@@ -503,11 +2035,31 @@ async def agent_status(agent_id: str, x_blaxing_source: Optional[str] = Header(d
     cached = await db.agent_state_cache.find_one({"agent_id": agent_id}, {"_id": 0})
     if not cached or cached.get("state") != state:
         await db.agent_state_cache.update_one({"agent_id": agent_id}, {"$set": {"state": state, "updated_at": now_iso()}}, upsert=True)
-        cfg = await get_hooks_config()
-        await emit_event(cfg.status_change_flow, "status_change", {"agent_id": agent_id, "state": state, "source": "mock"})
+        await safe_record_transition(agent_id, "mock", state, "status_change")
+        await emit_event("status_change", {"agent_id": agent_id, "state": state, "source": "mock"})
     return {"agent_id": agent_id, "state": state, "uptime": uptime, "status": "ok"}
 
 
+@api_router.get("/agents/{agent_id}/history", response_model=List[AgentEvent])
+async def agent_history(agent_id: str, limit: int = Query(default=100, ge=1, le=1000), before: Optional[datetime] = None, x_blaxing_source: Optional[str] = Header(default="mock")):
+    src = (x_blaxing_source or "mock").lower()
+    query: Dict[str, Any] = {"source": src, "agent_id": agent_id}
+    if before:
+        query["at"] = {"$lt": before}
+    return await db.agent_events.find(query, {"_id": 0}).sort("at", -1).limit(limit).to_list(length=limit)
+
+
+@api_router.get("/agents/{agent_id}/uptime", response_model=AgentUptime)
+async def agent_uptime(agent_id: str, from_: Optional[datetime] = Query(default=None, alias="from"), to: Optional[datetime] = None, x_blaxing_source: Optional[str] = Header(default="mock")):
+    src = (x_blaxing_source or "mock").lower()
+    # Windows are aligned to UTC days so they map onto whole daily aggregates.
+    end = day_start(as_utc(to)) + timedelta(days=1) if to else datetime.now(timezone.utc)
+    start = day_start(as_utc(from_)) if from_ else day_start(end - timedelta(days=7))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    return await compute_agent_uptime(agent_id, src, start, end)
+
+
 # ---- Hooks management ----
 
 @api_router.get("/hooks/config", response_model=HooksConfig)
@@ -520,32 +2072,123 @@ async def hooks_set_config(cfg: HooksConfig):
     return await set_hooks_config(cfg)
 
 
+@api_router.get("/hooks/subscriptions", response_model=List[WebhookSubscription])
+async def hooks_list_subscriptions():
+    return await db.webhook_subscriptions.find({}, {"_id": 0}).to_list(length=None)
+
+
+@api_router.post("/hooks/subscriptions", response_model=WebhookSubscription)
+async def hooks_create_subscription(body: WebhookSubscriptionCreate):
+    if body.event != "*" and body.event not in WEBHOOK_EVENTS:
+        raise HTTPException(status_code=400, detail=f"event must be '*' or one of {', '.join(sorted(WEBHOOK_EVENTS))}")
+    if bool(body.flow) == bool(body.url):
+        raise HTTPException(status_code=400, detail="Exactly one of 'flow' or 'url' is required")
+    sub = WebhookSubscription(**body.model_dump())
+    await db.webhook_subscriptions.insert_one(sub.model_dump())
+    await collection_versions.bump("webhook_subscriptions")
+    return sub
+
+
+@api_router.delete("/hooks/subscriptions/{subscription_id}")
+async def hooks_delete_subscription(subscription_id: str):
+    res = await db.webhook_subscriptions.delete_one({"id": subscription_id})
+    if not res.deleted_count:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    await collection_versions.bump("webhook_subscriptions")
+    return {"ok": True, "id": subscription_id}
+
+
 @api_router.post("/hooks/notify")
-async def hooks_notify(body: HookNotifyRequest):
-    res = send_n8n(body.flow, {"event": body.event, "data": body.data, "timestamp": now_iso()})
+@idempotent
+async def hooks_notify(body: HookNotifyRequest, idempotency_key: Optional[str] = Header(default=None)):
+    res = await asyncio.to_thread(send_n8n, body.flow, {"event": body.event, "data": body.data, "timestamp": now_iso()})
     return res
 
 
 @api_router.post("/n8n/trigger-url")
 async def n8n_trigger_url(body: TriggerUrlRequest):
-    return trigger_url(body.url, body.payload)
+    return await asyncio.to_thread(trigger_url, body.url, body.payload)
 
 
 # Include the router in the main app
 app.include_router(api_router)
 
+app.middleware("http")(admission_control)
+
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Data-Age", "X-Next-Cursor"],
 )
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# ---------- Warm-up ----------
+
+async def warm_mongo_pool():
+    # Retry until Mongo answers; readiness depends on it.
+    while True:
+        try:
+            await client.admin.command("ping")
+            break
+        except Exception as e:
+            logger.warning(f"mongo ping failed, retrying: {e}")
+            await asyncio.sleep(1)
+    # Concurrent pings force the driver to open that many pooled connections.
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(MONGO_MIN_POOL_SIZE)), return_exceptions=True)
+
+
+def preconnect_http():
+    if EMERGENT_DRY_RUN or not os.environ.get("BLA_API_KEY"):
+        return
+    for base in {BLAXING_API_BASE, BLAXING_STAGING_API_BASE}:
+        try:
+            http_session.get(f"{base}/health", headers={"X-API-KEY": os.environ["BLA_API_KEY"]}, timeout=REQ_TIMEOUT)
+        except requests.RequestException as e:
+            logger.warning(f"http preconnect failed base={base}: {e}")
+
+
+async def load_caches():
+    await ensure_seed_agents()
+    for name in ("agents", "status_checks"):
+        await collection_versions.get(name)
+    await webhook_dispatcher.refresh(force=True)
+
+
+async def start_status_buffer():
+    # Flushing before ensure_status_storage would create status_checks as a plain collection.
+    status_buffer.start()
+
+
+async def warm_up():
+    steps = [
+        ("mongo", warm_mongo_pool),
+        ("status_storage", ensure_status_storage),
+        ("write_behind", start_status_buffer),
+        ("agent_history_indexes", ensure_agent_history_indexes),
+        ("idempotency_indexes", idempotency_store.ensure_indexes),
+        ("agent_list_indexes", ensure_agent_list_indexes),
+        ("caches", load_caches),
+        ("http", lambda: asyncio.to_thread(preconnect_http)),
+        ("mirrors", start_mirrors),
+    ]
+    for name, step in steps:
+        started = time.monotonic()
+        try:
+            await step()
+        except Exception as e:
+            logger.exception(f"warm-up step {name} failed: {e}")
+        warmup["steps"][name] = round(time.monotonic() - started, 3)
+    warmup["cold_start_seconds"] = round(time.monotonic() - PROCESS_START, 3)
+    warmup["ready"] = True
+    logger.info(f"worker ready cold_start_seconds={warmup['cold_start_seconds']} steps={warmup['steps']}")
@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    """An in-memory database installed as server.db."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient(tz_aware=True)[os.environ["DB_NAME"]]
+    monkeypatch.setattr(server, "db", db)
+    return db
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """TestClient for the app, running its lifespan against an in-memory database."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from fastapi.testclient import TestClient
+
+    mongo = mongomock_motor.AsyncMongoMockClient(tz_aware=True)
+    monkeypatch.setattr(mongo, "close", lambda: None)
+    monkeypatch.setattr(server, "AsyncIOMotorClient", lambda *args, **kwargs: mongo)
+    monkeypatch.setattr(server, "agents_seeded", False)
+    monkeypatch.setattr(server, "rate_limiter", None)
+    monkeypatch.setattr(server, "warmup", {"ready": False, "cold_start_seconds": None, "steps": {}})
+    monkeypatch.setattr(server.collection_versions, "_cache", {})
+    with TestClient(server.app) as client:
+        # Warm-up runs in the background; let it finish so it doesn't race the test.
+        deadline = time.monotonic() + 5
+        while not server.warmup["ready"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        yield client
@@ -0,0 +1,82 @@
+import asyncio
+import ipaddress
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    return now
+
+
+def request(headers=None, peer="203.0.113.9"):
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return server.Request({"type": "http", "method": "GET", "path": "/api/agents/list", "headers": raw, "client": (peer, 1234)})
+
+
+def test_token_bucket_burst_then_refill(clock):
+    limiter = server.TokenBucketLimiter(rate=2, burst=3, max_keys=10)
+    assert [limiter.acquire("c") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("c") == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert limiter.acquire("c") == 0.0
+    assert limiter.acquire("other") == 0.0
+
+
+def test_full_table_evicts_least_recently_used(clock):
+    limiter = server.TokenBucketLimiter(rate=1, burst=1, max_keys=2)
+    assert limiter.acquire("throttled") == 0.0
+    assert limiter.acquire("idle") == 0.0
+    assert limiter.acquire("throttled") > 0
+    # A new client evicts "idle", not the client that is being throttled.
+    assert limiter.acquire("new") == 0.0
+    assert limiter.acquire("throttled") > 0
+    assert list(limiter._buckets) == ["new", "throttled"]
+
+
+def test_rate_limit_key_ignores_unvalidated_api_key():
+    assert server.rate_limit_key(request({"X-API-KEY": "one"})) == server.rate_limit_key(request({"X-API-KEY": "two"}))
+    assert server.rate_limit_key(request()) == "ip:203.0.113.9"
+
+
+def test_forwarded_for_is_trusted_only_from_proxies(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+    forwarded = {"X-Forwarded-For": "198.51.100.1, 192.0.2.7, 10.0.0.3"}
+    assert server.client_address(request(forwarded, peer="203.0.113.9")) == "203.0.113.9"
+    assert server.client_address(request(forwarded, peer="10.0.0.2")) == "192.0.2.7"
+    assert server.client_address(request({"X-Forwarded-For": "10.0.0.4"}, peer="10.0.0.2")) == "10.0.0.4"
+
+
+def test_admission_pool_sheds_after_queue_timeout():
+    pool = server.AdmissionPool("test", limit=1, queue_timeout=0.05)
+
+    async def scenario():
+        first = await pool.acquire()
+        second = await pool.acquire()
+        pool.release()
+        third = await pool.acquire()
+        pool.release()
+        return first, second, third
+
+    assert asyncio.run(scenario()) == (True, False, True)
+    assert pool.shed == 1
+    assert pool.in_flight == 0
+
+
+def test_rotating_api_keys_share_one_bucket(api, monkeypatch):
+    monkeypatch.setattr(server, "rate_limiter", server.TokenBucketLimiter(rate=0.001, burst=5, max_keys=100))
+    codes = [api.get("/api/", headers={"X-API-KEY": f"key-{i}"}).status_code for i in range(20)]
+    assert codes[:5] == [200] * 5
+    assert set(codes[5:]) == {429}
+
+
+def test_ingest_is_exempt_from_rate_limit(api, monkeypatch):
+    monkeypatch.setattr(server, "rate_limiter", server.TokenBucketLimiter(rate=0.001, burst=1, max_keys=100))
+    codes = [api.post("/api/status", json={"client_name": "web"}).status_code for _ in range(5)]
+    assert codes == [200] * 5
+    assert api.get("/api/").status_code == 200
+    assert api.get("/api/").status_code == 429
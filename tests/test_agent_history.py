@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import server
+
+
+def at(day, hour=0, minute=0):
+    return datetime(2026, 1, day, hour, minute, tzinfo=timezone.utc)
+
+
+def test_split_by_day():
+    assert server.split_by_day(at(1, 22), at(3, 2)) == [
+        (at(1), 2 * 3600.0),
+        (at(2), 24 * 3600.0),
+        (at(3), 2 * 3600.0),
+    ]
+    assert server.split_by_day(at(1, 5), at(1, 5)) == []
+
+
+def test_record_transition_skips_repeated_state(mock_db):
+    async def scenario():
+        first = await server.record_transition("sniper", "mock", "sleep", "register", at(1, 8))
+        repeat = await server.record_transition("sniper", "mock", "sleep", "status_change", at(1, 9))
+        second = await server.record_transition("sniper", "mock", "active", "activate", at(1, 10))
+        events = await mock_db.agent_events.find({}, {"_id": 0}).sort("at", 1).to_list(length=None)
+        return first, repeat, second, events
+
+    first, repeat, second, events = asyncio.run(scenario())
+    assert (first, repeat, second) == (None, None, "sleep")
+    assert [(e["from_state"], e["to_state"], e["trigger"]) for e in events] == [
+        (None, "sleep", "register"),
+        ("sleep", "active", "activate"),
+    ]
+
+
+def test_active_interval_is_split_across_days(mock_db):
+    async def scenario():
+        await server.record_transition("sniper", "prod", "active", "activate", at(1, 22))
+        await server.record_transition("sniper", "prod", "sleep", "deactivate", at(3, 2))
+        days = await mock_db.agent_uptime_daily.find({}, {"_id": 0}).sort("day", 1).to_list(length=None)
+        uptime = await server.compute_agent_uptime("sniper", "prod", at(2), at(3))
+        return days, uptime
+
+    days, uptime = asyncio.run(scenario())
+    assert [(d["day"], d.get("active_seconds", 0), d.get("transitions", 0)) for d in days] == [
+        (at(1), 2 * 3600, 1),
+        (at(2), 24 * 3600, 0),
+        (at(3), 2 * 3600, 1),
+    ]
+    assert uptime.active_seconds == 24 * 3600
+    assert uptime.availability == 1.0
+    assert uptime.transitions == 0
+    assert uptime.state == "sleep"
+
+
+def test_uptime_includes_the_open_active_interval(mock_db):
+    now = datetime.now(timezone.utc)
+
+    async def scenario():
+        await server.record_transition("crystal", "mock", "active", "activate", now - timedelta(hours=1))
+        return await server.compute_agent_uptime("crystal", "mock", now - timedelta(hours=2), now)
+
+    uptime = asyncio.run(scenario())
+    assert uptime.state == "active"
+    assert abs(uptime.active_seconds - 3600) <= 2
+    assert abs(uptime.availability - 0.5) < 0.001
+
+
+def test_record_transitions_applies_to_every_agent(mock_db):
+    async def scenario():
+        await server.record_transitions(["a", "b", "c"], "staging", "active", "activate-all")
+        return await mock_db.agent_state_current.find({}, {"_id": 0, "since": 0}).sort("agent_id", 1).to_list(length=None)
+
+    assert asyncio.run(scenario()) == [
+        {"agent_id": a, "source": "staging", "state": "active"} for a in ("a", "b", "c")
+    ]
@@ -0,0 +1,60 @@
+import asyncio
+
+import server
+
+
+def test_etag_matches_weakly():
+    assert server.etag_matches('W/"agents-3"', 'W/"agents-3"')
+    assert server.etag_matches('"agents-3"', 'W/"agents-3"')
+    assert server.etag_matches('W/"x", W/"agents-3"', 'W/"agents-3"')
+    assert server.etag_matches("*", 'W/"agents-3"')
+    assert not server.etag_matches(None, 'W/"agents-3"')
+    assert not server.etag_matches('W/"agents-2"', 'W/"agents-3"')
+
+
+def test_variants_get_distinct_etags(mock_db, monkeypatch):
+    monkeypatch.setattr(server.collection_versions, "_cache", {})
+
+    async def etag(variant):
+        response = server.Response()
+        request = server.Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+        assert await server.not_modified(request, response, "agents", variant) is None
+        return response.headers["ETag"]
+
+    async def scenario():
+        return await etag(""), await etag("state=active"), await etag("state=sleep"), await etag("state=active")
+
+    plain, active, sleep, active_again = asyncio.run(scenario())
+    assert len({plain, active, sleep}) == 3
+    assert active == active_again
+
+
+def test_agent_list_conditional_get(api):
+    first = api.get("/api/agents/list")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+
+    cached = api.get("/api/agents/list", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+
+    other_variant = api.get("/api/agents/list?state=active", headers={"If-None-Match": etag})
+    assert other_variant.status_code == 200
+
+    assert api.post("/api/agents/sniper/activate").status_code == 200
+    server.collection_versions._cache.clear()
+    changed = api.get("/api/agents/list", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_conditional_poll_skips_seeding(api, monkeypatch):
+    etag = api.get("/api/agents/list").headers["ETag"]
+    calls = []
+
+    async def ensure_seed_agents():
+        calls.append(1)
+
+    monkeypatch.setattr(server, "ensure_seed_agents", ensure_seed_agents)
+    assert api.get("/api/agents/list", headers={"If-None-Match": etag}).status_code == 304
+    assert calls == []
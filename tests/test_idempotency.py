@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+@pytest.fixture
+def idempotency(mock_db):
+    return server.IdempotencyStore(ttl=60, cache_size=8, wait_timeout=2, lease=30)
+
+
+def test_replays_first_response(idempotency):
+    calls = []
+
+    async def create():
+        calls.append(1)
+        return {"id": len(calls)}
+
+    async def scenario():
+        first = await idempotency.run("scope", "fp", create)
+        idempotency._lru.clear()  # force the replay to come from Mongo
+        second = await idempotency.run("scope", "fp", create)
+        third = await idempotency.run("scope", "fp", create)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first == {"id": 1}
+    assert calls == [1]
+    for replay in (second, third):
+        assert replay.headers["Idempotent-Replayed"] == "true"
+        assert replay.body == b'{"id":1}'
+
+
+def test_rejects_key_reuse_with_different_request(idempotency):
+    async def create():
+        return {"ok": True}
+
+    async def scenario():
+        await idempotency.run("scope", "fp", create)
+        await idempotency.run("scope", "other", create)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(scenario())
+    assert exc.value.status_code == 422
+
+
+def test_concurrent_waiters_run_once(idempotency):
+    calls = []
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"id": 1}
+
+    async def scenario():
+        return await asyncio.gather(*(idempotency.run("scope", "fp", create) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert calls == [1]
+    assert results[0] == {"id": 1}
+    assert all(r.headers["Idempotent-Replayed"] == "true" for r in results[1:])
+
+
+def test_failed_call_can_be_retried(idempotency):
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise HTTPException(status_code=502, detail="Upstream error")
+        return {"id": 2}
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await idempotency.run("scope", "fp", flaky)
+        return await idempotency.run("scope", "fp", flaky)
+
+    assert asyncio.run(scenario()) == {"id": 2}
+    assert len(calls) == 2
+
+
+def test_takes_over_expired_lease(idempotency):
+    async def create():
+        return {"id": 3}
+
+    async def scenario():
+        past = server.datetime.now(server.timezone.utc) - server.timedelta(seconds=1)
+        await server.db.idempotency_keys.insert_one({
+            "_id": "scope", "fingerprint": "fp", "state": "pending", "created_at": past, "pending_until": past,
+        })
+        result = await idempotency.run("scope", "fp", create)
+        return result, await server.db.idempotency_keys.find_one({"_id": "scope"})
+
+    result, doc = asyncio.run(scenario())
+    assert result == {"id": 3}
+    assert doc["state"] == "done"
+
+
+def test_live_claim_from_another_worker_times_out_with_409(idempotency):
+    idempotency.wait_timeout = 0.2
+
+    async def create():
+        return {"id": 4}
+
+    async def scenario():
+        later = server.datetime.now(server.timezone.utc) + server.timedelta(seconds=30)
+        await server.db.idempotency_keys.insert_one({
+            "_id": "scope", "fingerprint": "fp", "state": "pending", "created_at": later, "pending_until": later,
+        })
+        await idempotency.run("scope", "fp", create)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(scenario())
+    assert exc.value.status_code == 409
+
+
+def test_decorator_scopes_by_endpoint_and_key(mock_db, monkeypatch):
+    monkeypatch.setattr(server, "idempotency_store", server.IdempotencyStore(ttl=60, cache_size=8, wait_timeout=2, lease=30))
+    calls = []
+
+    @server.idempotent
+    async def endpoint(agent_id, x_api_key=None, idempotency_key=None):
+        calls.append(agent_id)
+        return {"agent_id": agent_id}
+
+    async def scenario():
+        await endpoint(agent_id="a", idempotency_key="k1")
+        await endpoint(agent_id="a", idempotency_key="k1")
+        await endpoint(agent_id="a", x_api_key="other-client", idempotency_key="k1")
+        await endpoint(agent_id="a")
+        with pytest.raises(HTTPException) as exc:
+            await endpoint(agent_id="b", idempotency_key="k1")
+        return exc.value.status_code
+
+    assert asyncio.run(scenario()) == 422
+    assert calls == ["a", "a", "a"]
@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Mutable upstream agent list served to the mirror."""
+    items = []
+
+    async def iter_upstream_items(path, api_key, source, header_base):
+        for it in list(items):
+            yield it
+
+    monkeypatch.setattr(server, "iter_upstream_items", iter_upstream_items)
+    return items
+
+
+def test_sync_writes_only_changes_and_deletes_missing(mock_db, upstream):
+    mirror = server.UpstreamMirror("prod", interval=60)
+    upstream[:] = [{"id": "a", "state": "active"}, {"id": "b"}, {"id": "c"}]
+
+    async def scenario():
+        first = await mirror.sync()
+        upstream[:] = [{"id": "a", "state": "sleep"}, {"id": "b"}]
+        second = await mirror.sync()
+        third = await mirror.sync()
+        docs = await mock_db.agents_mirror.find({}, {"_id": 0}).sort("agent_id", 1).to_list(length=None)
+        status = await mock_db.mirror_status.find_one({"_id": "prod"})
+        return first, second, third, docs, status
+
+    first, second, third, docs, status = asyncio.run(scenario())
+    assert (first, second, third) == (3, 2, 0)
+    assert [(d["agent_id"], d["state"], d["source"]) for d in docs] == [("a", "sleep", "prod"), ("b", "sleep", "prod")]
+    assert status["ok"] is True and status["changed"] == 0
+    assert mirror.synced_at is not None
+
+
+def test_load_resumes_from_persisted_mirror(mock_db, upstream):
+    upstream[:] = [{"id": "a"}, {"id": "b"}]
+
+    async def scenario():
+        await server.UpstreamMirror("staging", interval=60).sync()
+        restarted = server.UpstreamMirror("staging", interval=60)
+        await restarted.load()
+        return restarted, await restarted.sync()
+
+    restarted, changed = asyncio.run(scenario())
+    assert restarted.synced_at is not None
+    assert changed == 0
+
+
+def test_serves_only_the_key_it_was_synced_with(monkeypatch):
+    monkeypatch.setenv("BLA_API_KEY", "server-key")
+    mirror = server.UpstreamMirror("prod", interval=60)
+    assert not mirror.serves(None, None)
+    mirror.synced_at = datetime.now(timezone.utc)
+    assert mirror.serves(None, None)
+    assert mirror.serves("server-key", None)
+    assert not mirror.serves("someone-else", None)
+    assert not mirror.serves("server-key", "https://other.example/api")
+
+
+def test_list_agents_with_foreign_key_skips_mirror(mock_db, monkeypatch):
+    monkeypatch.setenv("BLA_API_KEY", "server-key")
+    mirror = server.UpstreamMirror("prod", interval=60)
+    mirror.synced_at = datetime.now(timezone.utc)
+    monkeypatch.setitem(server.mirrors, "prod", mirror)
+    monkeypatch.setattr(server, "agents_seeded", False)
+
+    async def rejected(api_key, source, header_base):
+        raise server.HTTPException(status_code=401, detail="bad key")
+
+    monkeypatch.setattr(server, "fetch_upstream_agents", rejected)
+
+    async def scenario():
+        await mock_db.agents_mirror.insert_one({"agent_id": "prod-only", "source": "prod", "name": "Prod"})
+        request = server.Request({"type": "http", "method": "GET", "path": "/api/agents/list", "headers": []})
+        kwargs = dict(state=None, image=None, name_prefix=None, sort="agent_id", limit=50, cursor=None, x_blaxing_source="prod", x_blaxing_base=None)
+        own = await server.list_agents(request, server.Response(), x_api_key="server-key", **kwargs)
+        foreign = await server.list_agents(request, server.Response(), x_api_key="someone-else", **kwargs)
+        return own, foreign
+
+    own, foreign = asyncio.run(scenario())
+    assert [a.agent_id for a in own] == ["prod-only"]
+    assert "prod-only" not in [a.agent_id for a in foreign]
+    assert {a.agent_id for a in foreign} == {a["agent_id"] for a in server.DEFAULT_AGENTS}
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+def mock_db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["test_database"]
+
+
+# ---------- JsonArrayStream ----------
+
+def parse_chunks(chunks):
+    parser = server.JsonArrayStream()
+    items = []
+    for chunk in chunks:
+        items += parser.feed(chunk)
+    return items + parser.close()
+
+
+def every_split(body: bytes):
+    for i in range(len(body) + 1):
+        yield [body[:i], body[i:]]
+    yield [body[i:i + 1] for i in range(len(body))]
+
+
+def test_json_array_stream_any_chunk_boundary():
+    body = ' [ {"agent_id": "a1", "name": "Élise"}, 1.5e3, -2, true, null, "x,]", [1, 2] ] '.encode()
+    expected = [{"agent_id": "a1", "name": "Élise"}, 1500.0, -2, True, None, "x,]", [1, 2]]
+    for chunks in every_split(body):
+        assert parse_chunks(chunks) == expected
+
+
+def test_json_array_stream_number_split_after_dot_and_exponent():
+    assert parse_chunks([b"[1.", b"5]"]) == [1.5]
+    assert parse_chunks([b"[2e", b"2,3]"]) == [200.0, 3]
+    assert parse_chunks([b"[tr", b"ue]"]) == [True]
+
+
+def test_json_array_stream_empty():
+    assert parse_chunks([b""]) == []
+    assert parse_chunks([b"[", b" ]"]) == []
+
+
+@pytest.mark.parametrize("chunks", [
+    [b"[1]x"],
+    [b"[1] ", b"[2]"],
+    [b"[1", b"x]"],
+    [b"[1.x]"],
+    [b"[1, 2"],
+    [b"{}"],
+    [b"[1 2]"],
+])
+def test_json_array_stream_rejects_malformed(chunks):
+    with pytest.raises(ValueError):
+        parse_chunks(chunks)
+
+
+# ---------- Keyset paging ----------
+
+AGENTS = [
+    {"agent_id": f"a{i:02d}", "name": name, "state": "active" if i % 2 else "sleep"}
+    for i, name in enumerate(["delta", "alpha", "charlie", "alpha", "bravo", "delta", "echo", "bravo"])
+]
+
+
+def walk_in_memory(sort, limit=3, **filters):
+    seen, cursor = [], None
+    while True:
+        page = server.AgentPage(sort=sort, limit=limit, cursor=cursor, **filters)
+        rows = server.page_in_memory(AGENTS, page)
+        seen += rows[:limit]
+        if len(rows) <= limit:
+            return seen
+        cursor = server.encode_cursor(page, rows[limit - 1])
+
+
+async def walk_mongo(coll, sort, limit=3, **filters):
+    seen, cursor = [], None
+    while True:
+        page = server.AgentPage(sort=sort, limit=limit, cursor=cursor, **filters)
+        query, order = server.agent_page_query(page)
+        rows = await coll.find(query, {"_id": 0}).sort(order).limit(limit + 1).to_list(limit + 1)
+        seen += rows[:limit]
+        if len(rows) <= limit:
+            return seen
+        cursor = server.encode_cursor(page, rows[limit - 1])
+
+
+@pytest.mark.parametrize("sort", ["agent_id", "-agent_id", "name", "-name"])
+def test_page_in_memory_cursor_round_trip(sort):
+    field = sort.lstrip("-")
+    expected = sorted(AGENTS, key=lambda d: (d[field], d["agent_id"]), reverse=sort.startswith("-"))
+    assert walk_in_memory(sort) == expected
+    assert walk_in_memory(sort, state="active") == [d for d in expected if d["state"] == "active"]
+
+
+@pytest.mark.parametrize("sort", ["agent_id", "-agent_id", "name", "-name"])
+def test_agent_page_query_matches_page_in_memory(sort):
+    coll = mock_db().agents
+
+    async def scenario():
+        await coll.insert_many([dict(d) for d in AGENTS])
+        return await walk_mongo(coll, sort), await walk_mongo(coll, sort, state="sleep")
+
+    full, sleeping = asyncio.run(scenario())
+    assert full == walk_in_memory(sort)
+    assert sleeping == walk_in_memory(sort, state="sleep")
+
+
+def test_cursor_must_match_sort():
+    cursor = server.encode_cursor(server.AgentPage(sort="name"), AGENTS[0])
+    with pytest.raises(HTTPException) as exc:
+        server.agent_page_query(server.AgentPage(sort="-name", cursor=cursor))
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException):
+        server.page_in_memory(AGENTS, server.AgentPage(cursor="not-a-cursor"))
+
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def at(hour, minute, second=0):
+    return datetime(2026, 1, 5, hour, minute, second, tzinfo=timezone.utc)
+
+
+def test_bucket_start():
+    ts = at(10, 42, 17)
+    assert server.bucket_start(ts, "1m") == at(10, 42)
+    assert server.bucket_start(ts, "1h") == at(10, 0)
+
+
+def test_rollups_accumulate_across_flushes(mock_db):
+    async def scenario():
+        await server.update_status_rollups([
+            {"client_name": "web", "timestamp": at(10, 1, 5)},
+            {"client_name": "web", "timestamp": at(10, 1, 50)},
+            {"client_name": "cli", "timestamp": at(10, 2)},
+        ])
+        await server.update_status_rollups([{"client_name": "web", "timestamp": at(10, 59)}])
+        return await mock_db.status_rollups.find({}, {"_id": 0}).to_list(length=None)
+
+    rows = {(r["bucket"], r["client_name"], r["start"]): r for r in asyncio.run(scenario())}
+    hour = rows[("1h", "web", at(10, 0))]
+    assert hour["count"] == 3
+    assert hour["first_seen"] == at(10, 1, 5)
+    assert hour["last_seen"] == at(10, 59)
+    assert rows[("1m", "web", at(10, 1))]["count"] == 2
+    assert rows[("1m", "cli", at(10, 2))]["count"] == 1
+    assert len(rows) == 5
+
+
+def test_status_stats_filters_by_client_and_window(mock_db):
+    async def scenario():
+        await server.update_status_rollups([
+            {"client_name": "web", "timestamp": at(8, 30)},
+            {"client_name": "web", "timestamp": at(10, 30)},
+            {"client_name": "cli", "timestamp": at(10, 30)},
+        ])
+        return await server.get_status_stats(client="web", bucket="1h", from_=at(9, 15), to=at(11, 0))
+
+    stats = asyncio.run(scenario())
+    assert [(s["client_name"], s["start"], s["count"]) for s in stats] == [("web", at(10, 0), 1)]
+
+
+def test_status_stats_rejects_unknown_bucket():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.get_status_stats(bucket="1d"))
+    assert exc.value.status_code == 400
+
+
+def test_legacy_string_timestamps_are_converted(mock_db):
+    async def scenario():
+        await mock_db.status_checks.insert_many([
+            {"id": "a", "client_name": "web", "timestamp": "2026-01-05T10:00:00+00:00"},
+            {"id": "b", "client_name": "web", "timestamp": "not a date"},
+            {"id": "c", "client_name": "web", "timestamp": at(11, 0)},
+        ])
+        migrated = await server.migrate_legacy_status_timestamps()
+        again = await server.migrate_legacy_status_timestamps()
+        docs = await mock_db.status_checks.find({}, {"_id": 0}).sort("id", 1).to_list(length=None)
+        return migrated, again, docs
+
+    migrated, again, docs = asyncio.run(scenario())
+    assert (migrated, again) == (2, 0)
+    assert all(isinstance(d["timestamp"], datetime) for d in docs)
+    assert docs[0]["timestamp"] == at(10, 0)
+    assert docs[2]["timestamp"] == at(11, 0)
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    monkeypatch.setattr(server, "EMERGENT_DRY_RUN", False)
+    d = server.WebhookDispatcher(timeout=1, dest_concurrency=2, dest_queue=3)
+    yield d
+    asyncio.run(d.drain(timeout=0))
+
+
+def test_targets_filter_and_dedup(dispatcher):
+    dispatcher._table = {
+        "agent_activation": [
+            ("https://a", None, None),
+            ("https://b", frozenset({"sniper"}), None),
+            ("https://c", None, frozenset({"prod"})),
+            ("https://a", frozenset({"sniper"}), None),
+        ],
+        "*": [("https://all", None, None), ("https://a", None, None)],
+    }
+    assert dispatcher.targets("agent_activation", {"agent_id": "sniper", "source": "mock"}) == ["https://a", "https://b", "https://all"]
+    assert dispatcher.targets("agent_activation", {"agent_id": "sonia", "source": "prod"}) == ["https://a", "https://c", "https://all"]
+    assert dispatcher.targets("status_change", {"agent_id": "sonia"}) == ["https://all", "https://a"]
+
+
+def test_refresh_compiles_flows_and_enabled_subscriptions(mock_db, dispatcher):
+    async def scenario():
+        await server.set_hooks_config(server.HooksConfig(activation_flow="on_activate"))
+        await mock_db.webhook_subscriptions.insert_many([
+            {"event": "agent_activation", "url": "https://sub", "agent_ids": ["crystal"], "enabled": True},
+            {"event": "agent_activation", "url": "https://off", "enabled": False},
+            {"event": "*", "flow": "audit", "sources": ["prod"], "enabled": True},
+        ])
+        await dispatcher.refresh(force=True)
+
+    asyncio.run(scenario())
+    flow = server.n8n_target("on_activate")
+    audit = server.n8n_target("audit")
+    assert dispatcher.targets("agent_activation", {"agent_id": "crystal", "source": "prod"}) == [flow, "https://sub", audit]
+    assert dispatcher.targets("agent_activation", {"agent_id": "sniper", "source": "mock"}) == [flow]
+
+
+def test_slow_destination_does_not_delay_others(dispatcher, monkeypatch):
+    release = threading.Event()
+    delivered = []
+
+    def post_webhook(url, payload, timeout):
+        if url == "https://slow":
+            release.wait(5)
+        delivered.append((url, time.monotonic()))
+        return 200
+
+    monkeypatch.setattr(server, "post_webhook", post_webhook)
+
+    async def scenario():
+        dispatcher._table = {"agent_activation": [("https://slow", None, None), ("https://fast", None, None)]}
+        started = time.monotonic()
+        for _ in range(3):
+            await dispatcher.dispatch("agent_activation", {"agent_id": "sniper"})
+        while len([u for u, _ in delivered if u == "https://fast"]) < 3:
+            await asyncio.sleep(0.01)
+        fast_done = time.monotonic() - started
+        slow_running = dispatcher._queued.get("https://slow")
+        release.set()
+        await dispatcher.drain(timeout=5)
+        return fast_done, slow_running
+
+    fast_done, slow_running = asyncio.run(scenario())
+    assert fast_done < 1
+    assert slow_running == 3
+    assert len(delivered) == 6
+
+
+def test_full_destination_queue_drops_and_counts(dispatcher, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(server, "post_webhook", lambda url, payload, timeout: release.wait(5) and 200)
+
+    async def scenario():
+        dispatcher._table = {"status_change": [("https://slow", None, None)]}
+        accepted = [await dispatcher.dispatch("status_change", {"agent_id": "a"}) for _ in range(5)]
+        release.set()
+        await dispatcher.drain(timeout=5)
+        return accepted
+
+    assert asyncio.run(scenario()) == [1, 1, 1, 0, 0]
+    assert dispatcher.dropped == {"https://slow": 2}
+    assert dispatcher._queued == {}
+
+
+def test_threads_are_held_until_delivery_finishes(dispatcher, monkeypatch):
+    release = threading.Event()
+    running = []
+
+    def post_webhook(url, payload, timeout):
+        running.append(threading.current_thread().name)
+        release.wait(5)
+        return 200
+
+    monkeypatch.setattr(server, "post_webhook", post_webhook)
+
+    async def scenario():
+        dispatcher._table = {"status_change": [("https://slow", None, None)]}
+        for _ in range(3):
+            await dispatcher.dispatch("status_change", {"agent_id": "a"})
+        await asyncio.sleep(0.2)
+        concurrent = len(running)
+        release.set()
+        await dispatcher.drain(timeout=5)
+        return concurrent
+
+    # dest_concurrency=2: the third delivery waits for a thread instead of starting a new one.
+    assert asyncio.run(scenario()) == 2
+    assert len(running) == 3
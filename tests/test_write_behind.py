@@ -0,0 +1,96 @@
+import asyncio
+
+import server
+
+
+class FailingCollection:
+    def __init__(self, failures):
+        self.failures = failures
+        self.docs = []
+
+    async def insert_many(self, docs, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("mongo unavailable")
+        self.docs += docs
+        return type("InsertManyResult", (), {"inserted_ids": [None] * len(docs)})()
+
+
+def test_offer_refuses_past_max_pending():
+    buf = server.WriteBehindBuffer("statuses", batch_size=2, flush_interval=1, max_pending=4)
+    assert buf.offer([{"i": 1}, {"i": 2}, {"i": 3}])
+    assert not buf.offer([{"i": 4}, {"i": 5}])
+    assert buf.offer([{"i": 4}])
+    assert buf.pending == 4
+
+
+def test_flush_writes_in_batches(monkeypatch):
+    coll = FailingCollection(failures=0)
+    monkeypatch.setattr(server, "db", {"statuses": coll})
+    batches = []
+
+    async def on_flush(docs):
+        batches.append(len(docs))
+
+    buf = server.WriteBehindBuffer("statuses", batch_size=2, flush_interval=1, max_pending=10, on_flush=on_flush)
+    buf.offer([{"i": i} for i in range(5)])
+    assert asyncio.run(buf.flush()) == 5
+    assert batches == [2, 2, 1]
+
+
+def test_requeues_failed_batch(monkeypatch):
+    coll = FailingCollection(failures=1)
+    monkeypatch.setattr(server, "db", {"statuses": coll})
+    flushed = []
+
+    async def on_flush(docs):
+        flushed.extend(docs)
+
+    buf = server.WriteBehindBuffer("statuses", batch_size=2, flush_interval=1, max_pending=10, on_flush=on_flush)
+    docs = [{"i": i} for i in range(5)]
+    buf.offer(docs)
+
+    assert asyncio.run(buf.flush()) == 0
+    assert buf.pending == 5
+    assert asyncio.run(buf.flush()) == 5
+    assert buf.pending == 0
+    assert coll.docs == docs
+    assert flushed == docs
+
+
+def test_drops_batch_when_requeue_would_overflow(monkeypatch):
+    coll = FailingCollection(failures=1)
+    monkeypatch.setattr(server, "db", {"statuses": coll})
+    buf = server.WriteBehindBuffer("statuses", batch_size=2, flush_interval=1, max_pending=4)
+    buf.offer([{"i": i} for i in range(4)])
+
+    async def scenario():
+        # Refill the freed slots while the first batch is in flight.
+        original = coll.insert_many
+
+        async def insert_many(docs, ordered=True):
+            buf.offer([{"i": 10}, {"i": 11}])
+            return await original(docs, ordered)
+
+        coll.insert_many = insert_many
+        return await buf.flush()
+
+    assert asyncio.run(scenario()) == 0
+    assert [d["i"] for d in buf._pending] == [2, 3, 10, 11]
+
+
+def test_stop_flushes_only_a_started_buffer(monkeypatch):
+    coll = FailingCollection(failures=0)
+    monkeypatch.setattr(server, "db", {"statuses": coll})
+
+    async def scenario():
+        idle = server.WriteBehindBuffer("statuses", batch_size=10, flush_interval=60, max_pending=10)
+        idle.offer([{"i": 0}])
+        await idle.stop()
+        running = server.WriteBehindBuffer("statuses", batch_size=10, flush_interval=60, max_pending=10)
+        running.start()
+        running.offer([{"i": 1}])
+        await running.stop()
+
+    asyncio.run(scenario())
+    assert coll.docs == [{"i": 1}]